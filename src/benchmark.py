@@ -0,0 +1,419 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+ネットワークとカスタム関数の処理時間を計測するモジュール。
+'''
+
+import os
+import sys
+import json
+import argparse
+import platform
+import subprocess
+import time
+import tracemalloc
+import numpy
+import chainer
+import mylib
+from chainer.functions.connection.convolution_2d import Convolution2DFunction
+from mylib.functions.connection.grouped_convolution_2d import GroupedConvolution2DFunction
+from network import pyramid
+from network import shakenet
+from sweep import THREAD_VARIABLES, parse_network
+from train import create_network
+
+# cases of the benchmark suite: networks at typical configurations and custom functions
+SUITE_CASES = ['resnet:110,1', 'resnet:28,10', 'pyramid:110,48', 'pyramid:272,200', 'densenet:40,12',
+               'densenet:100,12', 'resnext:29,64,8', 'shakenet:26,2', 'shakenet:26,6',
+               'grouped_convolution_2d', 'shake_noise']
+
+
+class LoopGroupedConvolution2DFunction(chainer.Function):
+  '''reference implementation which convolves every group one by one'''
+  def __init__(self, stride=1, pad=0):
+    super().__init__()
+    self.conv = Convolution2DFunction(stride=stride, pad=pad)
+
+  def forward(self, inputs):
+    x, W, b = inputs
+    y = numpy.empty((W.shape[0], x.shape[0], W.shape[1], x.shape[2], x.shape[3]), dtype=x.dtype)
+    c = W.shape[2]
+
+    for i in range(len(W)):
+      y[i, :] = self.conv.forward([x[:, i * c:(i + 1) * c, :], W[i], b[i]])[0]
+
+    y = numpy.rollaxis(y, 1)
+    y = y.reshape(y.shape[0], y.shape[1] * y.shape[2], *y.shape[3:])
+
+    return y,
+
+  def backward(self, inputs, grad_outputs):
+    x, W, b = inputs
+    gy = grad_outputs[0]
+    cx = W.shape[2]
+    cy = W.shape[1]
+
+    gx = numpy.zeros((W.shape[0], x.shape[0], W.shape[2], *x.shape[2:]), dtype=x.dtype)
+    gW = numpy.zeros_like(W)
+    gb = numpy.zeros_like(b)
+
+    for i in range(len(W)):
+      # the convolution keeps the columns of the last forward computation, so the group is computed again
+      inputs = [x[:, i * cx:(i + 1) * cx, :], W[i], b[i]]
+      self.conv.forward(inputs)
+      g = self.conv.backward(inputs, [gy[:, i * cy:(i + 1) * cy, :]])
+      gx[i, :] = g[0]
+      gW[i, :] = g[1]
+      gb[i, :] = g[2]
+
+    gx = numpy.rollaxis(gx, 1)
+    gx = gx.reshape(gx.shape[0], gx.shape[1] * gx.shape[2], *gx.shape[3:])
+
+    return gx, gW, gb
+
+
+def reshape(x, channels):
+  '''reference implementation which pads the shortcut with a zero tensor'''
+  if x.shape[1] < channels:
+    xp = chainer.cuda.get_array_module(x)
+    p = xp.zeros((x.shape[0], channels - x.shape[1], x.shape[2], x.shape[3]), dtype=x.dtype)
+    x = chainer.functions.concat((x, p), axis=1)
+  elif x.shape[1] > channels:
+    x = x[:, :channels, :]
+
+  return x
+
+
+def concat_forward(self, x):
+  '''reference implementation of `ResidualBlock._forward`'''
+  for layer in self:
+    y = layer(x)
+    y += reshape(x, y.shape[1])
+    x = y
+
+  return x
+
+
+def measure(func, repeat):
+  '''returns the minimum elapsed time (sec) of the function'''
+  times = []
+
+  for _ in range(repeat):
+    start = time.perf_counter()
+    func()
+    times.append(time.perf_counter() - start)
+
+  return min(times)
+
+
+def grouped_convolution(args):
+  '''compares the fused grouped convolution with the loop implementation'''
+  print('units, forward(loop), forward(fused), backward(loop), backward(fused), speedup, error')
+
+  for units in args.units:
+    x = numpy.random.uniform(-1, 1, (args.batchsize, args.channels, args.size, args.size)).astype(numpy.float32)
+    W = numpy.random.normal(0, 0.1, (units, args.channels // units, args.channels // units, 3, 3))
+    W = W.astype(numpy.float32)
+    b = numpy.random.normal(0, 0.1, (units, args.channels // units)).astype(numpy.float32)
+    gy = numpy.random.uniform(-1, 1, x.shape).astype(numpy.float32)
+    inputs = (x, W, b)
+
+    loop = LoopGroupedConvolution2DFunction(stride=1, pad=1)
+    fused = GroupedConvolution2DFunction(stride=1, pad=1)
+
+    outputs = loop.forward(inputs) + loop.backward(inputs, (gy,))
+    fused_outputs = fused.forward(inputs) + fused.backward(inputs, (gy,))
+    error = max(float(numpy.abs(a - b).max()) for a, b in zip(outputs, fused_outputs))
+
+    loop_forward = measure(lambda: loop.forward(inputs), args.repeat)
+    loop_backward = measure(lambda: loop.backward(inputs, (gy,)), args.repeat)
+    fused_forward = measure(lambda: fused.forward(inputs), args.repeat)
+    fused_backward = measure(lambda: fused.backward(inputs, (gy,)), args.repeat)
+    speedup = (loop_forward + loop_backward) / (fused_forward + fused_backward)
+
+    print('{}, {:.2f}ms, {:.2f}ms, {:.2f}ms, {:.2f}ms, {:.2f}x, {:.2e}'.format(
+      units, loop_forward * 1000, fused_forward * 1000, loop_backward * 1000, fused_backward * 1000,
+      speedup, error))
+
+
+def shortcut(args):
+  '''compares the in-place shortcut addition with the zero-padding concatenation on PyramidNet'''
+  network = pyramid.Network(10, args.params)
+  x = numpy.random.uniform(-1, 1, (args.batchsize, 3, 32, 32)).astype(numpy.float32)
+  forward = pyramid.ResidualBlock._forward
+  results = {}
+
+  for name, func in (('concat', concat_forward), ('inplace', forward)):
+    pyramid.ResidualBlock._forward = func
+
+    def run():
+      network.cleargrads()
+      y = network(x)
+      chainer.functions.sum(y).backward()
+      results[name] = (y.data, network.input.W.grad.copy())
+
+    try:
+      results[name + '_time'] = measure(run, args.repeat)
+    finally:
+      pyramid.ResidualBlock._forward = forward
+
+  error = max(float(numpy.abs(a - b).max()) for a, b in zip(results['concat'], results['inplace']))
+
+  print('params, iteration(concat), iteration(inplace), speedup, error')
+  print('{}, {:.2f}ms, {:.2f}ms, {:.2f}x, {:.2e}'.format(
+    '/'.join(str(v) for v in args.params), results['concat_time'] * 1000, results['inplace_time'] * 1000,
+    results['concat_time'] / results['inplace_time'], error))
+
+
+def fuse_shake_unit(unit, fused):
+  '''copies the parameters of the two lines of a ShakeUnit to a FusedShakeUnit'''
+  lines = (unit.line1, unit.line2)
+
+  for name in ('norm0', 'norm1', 'norm2'):
+    for attr in ('gamma', 'beta'):
+      values = [getattr(getattr(line, name), attr).data for line in lines]
+      getattr(getattr(fused, name), attr).data[...] = numpy.concatenate(values)
+
+  for name in ('conv1', 'conv2'):
+    for attr in ('W', 'b'):
+      values = [getattr(getattr(line, name), attr).data for line in lines]
+      getattr(getattr(fused, name), attr).data[...] = numpy.stack(values)
+
+
+def shake(args):
+  '''compares the fused shake unit with the unit computing the two lines one by one'''
+  print('params, iteration(two lines), iteration(fused), speedup, error')
+
+  for params in ([26, 2], [26, 6]):
+    networks = [shakenet.Network(10, params), shakenet.Network(10, params, fused=True)]
+    x = numpy.random.uniform(-1, 1, (args.batchsize, 3, 32, 32)).astype(numpy.float32)
+
+    with chainer.using_config('train', False), chainer.no_backprop_mode():
+      for network in networks:
+        network(x[:1])
+
+    for name in ('input', 'norm', 'output'):
+      params_src = getattr(networks[0], name).params()
+      params_dst = getattr(networks[1], name).params()
+
+      for src, dst in zip(params_src, params_dst):
+        dst.data[...] = src.data
+
+    for name in ('block1', 'block2', 'block3'):
+      for unit, fused in zip(getattr(networks[0], name), getattr(networks[1], name)):
+        fuse_shake_unit(unit, fused)
+
+    with chainer.using_config('train', False), chainer.no_backprop_mode():
+      y1, y2 = [network(x).data for network in networks]
+
+    error = float(numpy.abs(y1 - y2).max())
+    times = []
+
+    for network in networks:
+      def run():
+        network.cleargrads()
+        chainer.functions.sum(network(x)).backward()
+
+      times.append(measure(run, args.repeat))
+
+    print('{}, {:.2f}ms, {:.2f}ms, {:.2f}x, {:.2e}'.format(
+      '/'.join(str(v) for v in params), times[0] * 1000, times[1] * 1000, times[0] / times[1], error))
+
+
+def _create_case(case, batchsize):
+  '''returns the function computing the loss of the case and the update function'''
+  if case == 'grouped_convolution_2d':
+    x = chainer.Variable(numpy.random.uniform(-1, 1, (batchsize, 256, 16, 16)).astype(numpy.float32))
+    W = chainer.Variable(numpy.random.normal(0, 0.1, (32, 8, 8, 3, 3)).astype(numpy.float32))
+    b = chainer.Variable(numpy.zeros((32, 8), dtype=numpy.float32))
+
+    def forward():
+      for v in (x, W, b):
+        v.cleargrad()
+
+      return chainer.functions.sum(mylib.functions.grouped_convolution_2d(x, W, b, 1, 1))
+
+    return forward, lambda: None
+
+  elif case == 'shake_noise':
+    x1 = chainer.Variable(numpy.random.uniform(-1, 1, (batchsize, 64, 32, 32)).astype(numpy.float32))
+    x2 = chainer.Variable(numpy.random.uniform(-1, 1, (batchsize, 64, 32, 32)).astype(numpy.float32))
+
+    # x1 is overwritten by the mixed values in place, which stay in the same range and do not change the time
+    def forward():
+      for v in (x1, x2):
+        v.cleargrad()
+
+      return chainer.functions.sum(mylib.functions.shake_noise(x1, x2))
+
+    return forward, lambda: None
+
+  else:
+    name, params = parse_network(case)
+    model = chainer.links.Classifier(create_network(name, 10, params))
+    optimizer = chainer.optimizers.MomentumSGD(lr=0.01)
+    optimizer.setup(model)
+
+    x = numpy.random.uniform(0, 1, (batchsize, 3, 32, 32)).astype(numpy.float32)
+    t = numpy.random.randint(0, 10, batchsize).astype(numpy.int32)
+
+    def forward():
+      model.cleargrads()
+      return model(x, t)
+
+    return forward, optimizer.update
+
+
+def measure_case(case, batchsize, repeat):
+  '''returns the minimum elapsed time (sec) of forward, backward and iteration,
+  and the peak size of memory allocated in an iteration'''
+  forward, update = _create_case(case, batchsize)
+
+  def iterate():
+    start = time.perf_counter()
+    loss = forward()
+    middle = time.perf_counter()
+    loss.backward()
+    end = time.perf_counter()
+    update()
+
+    return middle - start, end - middle, time.perf_counter() - start
+
+  iterate()
+  times = numpy.array([iterate() for _ in range(repeat)]).min(axis=0)
+
+  tracemalloc.start()
+  iterate()
+  peak = tracemalloc.get_traced_memory()[1]
+  tracemalloc.stop()
+
+  return times[0], times[1], times[2], peak
+
+
+def case(args):
+  '''measures the case in this process and writes the results as JSON lines'''
+  for batchsize in args.batchsizes:
+    forward, backward, iteration, peak = measure_case(args.case, batchsize, args.repeat)
+    result = {'case': args.case, 'threads': int(os.environ.get(THREAD_VARIABLES[0], 0)),
+              'batchsize': batchsize, 'forward': forward, 'backward': backward, 'iteration': iteration,
+              'images_per_sec': batchsize / iteration, 'peak_memory': peak}
+
+    print(json.dumps(result))
+    sys.stdout.flush()
+
+
+def suite(args):
+  '''measures every case with every number of threads in subprocesses'''
+  results = []
+  script = os.path.abspath(__file__)
+
+  print('case, threads, batchsize, forward, backward, iteration, images/sec, peak memory')
+
+  for case_name in args.cases:
+    for threads in args.threads:
+      env = dict(os.environ)
+
+      for name in THREAD_VARIABLES:
+        env[name] = str(threads)
+
+      command = [sys.executable, script, 'case', '--case', case_name, '--repeat', str(args.repeat),
+                 '--batchsizes'] + [str(v) for v in args.batchsizes]
+      output = subprocess.check_output(command, env=env, universal_newlines=True)
+
+      for line in output.splitlines():
+        result = json.loads(line)
+        results.append(result)
+
+        print('{}, {}, {}, {:.2f}ms, {:.2f}ms, {:.2f}ms, {:.1f}, {:.1f}MB'.format(
+          result['case'], result['threads'], result['batchsize'], result['forward'] * 1000,
+          result['backward'] * 1000, result['iteration'] * 1000, result['images_per_sec'],
+          result['peak_memory'] / 1000000))
+
+  report = {'environment': {'python': platform.python_version(), 'numpy': numpy.__version__,
+                            'chainer': chainer.__version__, 'machine': platform.machine(),
+                            'processor': platform.processor(), 'cpus': os.cpu_count()},
+            'repeat': args.repeat,
+            'results': results}
+
+  with open(args.output, 'w') as handle:
+    json.dump(report, handle, indent=2)
+
+  if args.compare is not None:
+    if compare(args.compare, results, args.tolerance) != 0:
+      sys.exit(1)
+
+
+def compare(path, results, tolerance):
+  '''compares the iteration time with the baseline and returns the number of regressions'''
+  with open(path, 'r') as handle:
+    baseline = {(v['case'], v['threads'], v['batchsize']): v for v in json.load(handle)['results']}
+
+  regressions = 0
+
+  print('case, threads, batchsize, iteration(baseline), iteration, ratio, status')
+
+  for result in results:
+    base = baseline.get((result['case'], result['threads'], result['batchsize']))
+
+    if base is None:
+      continue
+
+    ratio = result['iteration'] / base['iteration']
+    status = 'regression' if ratio > 1 + tolerance else 'ok'
+    regressions += status == 'regression'
+
+    print('{}, {}, {}, {:.2f}ms, {:.2f}ms, {:.2f}x, {}'.format(
+      result['case'], result['threads'], result['batchsize'], base['iteration'] * 1000,
+      result['iteration'] * 1000, ratio, status))
+
+  return regressions
+
+
+def main():
+  parser = argparse.ArgumentParser(description='benchmark of networks and custom functions')
+  parser.add_argument('target', metavar='TARGET',
+                      choices=('grouped_convolution', 'shortcut', 'shake', 'suite', 'case'),
+                      help='target of benchmark')
+  parser.add_argument('--cases', nargs='+', default=SUITE_CASES,
+                      metavar='CASE', help='cases of the suite (NETWORK:PARAMS or name of a function)')
+  parser.add_argument('--case', default=None,
+                      metavar='CASE', help='case measured by the target \'case\'')
+  parser.add_argument('--batchsizes', type=int, nargs='+', default=[1, 32, 128],
+                      metavar='BATCH_SIZE', help='batch sizes of the suite')
+  parser.add_argument('--threads', type=int, nargs='+', default=sorted({1, os.cpu_count()}),
+                      metavar='THREADS', help='numbers of threads of the suite')
+  parser.add_argument('--output', '-o', default='benchmark.json',
+                      metavar='FILE', help='JSON file of results of the suite')
+  parser.add_argument('--compare', default=None,
+                      metavar='FILE', help='JSON file of the baseline compared with results of the suite')
+  parser.add_argument('--tolerance', type=float, default=0.1,
+                      metavar='RATIO', help='allowed ratio of increase of iteration time from the baseline')
+  parser.add_argument('--units', type=int, nargs='+', default=[1, 2, 4, 8, 16, 32],
+                      metavar='UNITS', help='numbers of groups of convolution')
+  parser.add_argument('--params', type=int, nargs='+', default=[272, 200],
+                      metavar='PARAMS', help='parameters of PyramidNet (depth and alpha)')
+  parser.add_argument('--channels', type=int, default=256,
+                      metavar='CHANNELS', help='number of channels')
+  parser.add_argument('--size', type=int, default=16,
+                      metavar='SIZE', help='height and width of images')
+  parser.add_argument('--batchsize', '-b', type=int, default=64,
+                      metavar='BATCH_SIZE', help='number of images')
+  parser.add_argument('--repeat', type=int, default=10,
+                      metavar='REPEAT', help='number of measurements')
+  args = parser.parse_args()
+
+  if args.target == 'grouped_convolution':
+    grouped_convolution(args)
+  elif args.target == 'shortcut':
+    shortcut(args)
+  elif args.target == 'shake':
+    shake(args)
+  elif args.target == 'suite':
+    suite(args)
+  elif args.target == 'case':
+    case(args)
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,216 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+学習済みのネットワークから推論用のモデルを生成するモジュール。
+Convolutionに続くBatch Normalizationは、Convolutionの重みとバイアスに畳み込まれます。
+'''
+
+import os
+import argparse
+import copy
+import tempfile
+import time
+import numpy
+import chainer
+import mylib
+from chainer import variable
+from train import SNAPSHOT_PREFIX, create_network, get_result_dir, load_dataset, load_network_args
+
+# pairs of a convolution and the normalization applied to its output.
+# all networks name them as below in every chain.
+FOLDABLE_LINKS = [('input', 'norm')] + [('conv{}'.format(i), 'norm{}'.format(i)) for i in range(1, 10)]
+
+
+class Identity(chainer.Link):
+  '''link which returns the input as it is'''
+  def __call__(self, x):
+    return x
+
+
+def load_network(network, path, x):
+  '''initializes the network by the input and loads the parameters from a snapshot of the trainer'''
+  with chainer.using_config('train', False), chainer.no_backprop_mode():
+    network(x)
+
+  with numpy.load(path) as npz:
+    chainer.serializers.NpzDeserializer(npz, path=SNAPSHOT_PREFIX).load(network)
+
+
+def fold_batch_normalization(network):
+  '''folds every foldable BatchNormalization into the preceding convolution.
+  The folded BatchNormalization is replaced with an identity link.
+  Returns the number of folded links.
+  '''
+  count = 0
+
+  for chain in list(network.links()):
+    if not isinstance(chain, chainer.Chain):
+      continue
+
+    for conv_name, norm_name in FOLDABLE_LINKS:
+      conv = getattr(chain, conv_name, None)
+      norm = getattr(chain, norm_name, None)
+
+      if not isinstance(conv, (chainer.links.Convolution2D, mylib.links.GroupedConvolution2D)):
+        continue
+
+      if not isinstance(norm, chainer.links.BatchNormalization):
+        continue
+
+      _fold(conv, norm)
+
+      delattr(chain, norm_name)
+
+      with chain.init_scope():
+        setattr(chain, norm_name, Identity())
+
+      count += 1
+
+  return count
+
+
+def _fold(conv, norm):
+  xp = chainer.cuda.get_array_module(conv.W.data)
+  scale = norm.gamma.data / xp.sqrt(norm.avg_var + norm.eps)
+  shift = norm.beta.data - norm.avg_mean * scale
+
+  W = conv.W.data.reshape(scale.size, -1)
+  W *= scale[:, None]
+
+  if conv.b is None:
+    with conv.init_scope():
+      conv.b = variable.Parameter(xp.zeros(conv.W.shape[:-3], dtype=conv.W.dtype))
+
+  b = conv.b.data.reshape(scale.size)
+  b *= scale
+  b += shift
+
+
+def load_inference_model(network, path, x):
+  '''initializes the network by the input, folds it and loads the parameters of the exported model'''
+  with chainer.using_config('train', False), chainer.no_backprop_mode():
+    network(x)
+
+  fold_batch_normalization(network)
+  chainer.serializers.load_npz(path, network)
+
+
+def save_random_snapshot(path, network, x, seed=0):
+  '''saves the network with random parameters and statistics of batch normalizations
+  as the model of a snapshot of the trainer (used to check the export without a trained model)'''
+  random = numpy.random.RandomState(seed)
+
+  with chainer.using_config('train', False), chainer.no_backprop_mode():
+    network(x)
+
+  for link in network.links():
+    if isinstance(link, chainer.links.BatchNormalization):
+      link.gamma.data[...] = random.uniform(0.5, 1.5, link.gamma.shape)
+      link.beta.data[...] = random.uniform(-0.5, 0.5, link.beta.shape)
+      link.avg_mean[...] = random.uniform(-0.5, 0.5, link.avg_mean.shape)
+      link.avg_var[...] = random.uniform(0.5, 1.5, link.avg_var.shape)
+
+  serializer = chainer.serializers.DictionarySerializer(path=SNAPSHOT_PREFIX)
+  serializer.save(network)
+  numpy.savez(path, **serializer.target)
+
+
+def measure(network, x, repeat):
+  '''returns the median of elapsed time (sec) of inference'''
+  times = []
+
+  with chainer.using_config('train', False), chainer.no_backprop_mode():
+    for _ in range(repeat):
+      start = time.perf_counter()
+      network(x)
+      times.append(time.perf_counter() - start)
+
+  return float(numpy.median(times))
+
+
+def export(args, category, x, model_path, output_path):
+  '''exports the model for inference and verifies it'''
+  network_args = load_network_args(model_path, SNAPSHOT_PREFIX)
+  network = create_network(args.network, category, args.params, **network_args)
+  load_network(network, model_path, x)
+
+  original = copy.deepcopy(network)
+  count = fold_batch_normalization(network)
+  chainer.serializers.save_npz(output_path, network)
+
+  # verify the exported model
+  exported = create_network(args.network, category, args.params, **network_args)
+  load_inference_model(exported, output_path, x)
+
+  with chainer.using_config('train', False), chainer.no_backprop_mode():
+    y1 = original(x).data
+    y2 = exported(x).data
+
+  error = float(numpy.abs(y1 - y2).max() / max(numpy.abs(y1).max(), 1e-8))
+  original_time = measure(original, x, args.repeat)
+  exported_time = measure(exported, x, args.repeat)
+
+  print('folded links: {}'.format(count))
+  print('output: {} ({:.2f}MB)'.format(output_path, os.path.getsize(output_path) / 1000000))
+  print('error: {:.2e}'.format(error))
+  print('latency: {:.2f}ms -> {:.2f}ms (batch size: {})'.format(
+    original_time * 1000, exported_time * 1000, len(x)))
+
+  if error > args.tolerance:
+    raise Exception('outputs of the exported model do not match: {:.2e}'.format(error))
+
+
+def main():
+  parser = argparse.ArgumentParser(description='network exporter for inference')
+  parser.add_argument('dataset', metavar='DATASET', help='datasets name')
+  parser.add_argument('network', metavar='NETWORK', help='network name')
+  parser.add_argument('params', type=int, nargs='*', metavar='PARAMS', help='parameters')
+  parser.add_argument('--learning', '-l', default='step', choices=('step', 'cosine', 'restart'),
+                      metavar='NAME', help='name of learning rate control')
+  parser.add_argument('--model', default=None,
+                      metavar='FILE', help='snapshot of trainer (default: bestshot.npz of the result)')
+  parser.add_argument('--output', '-o', default=None,
+                      metavar='FILE', help='exported model (default: inference.npz of the result)')
+  parser.add_argument('--batchsize', '-b', type=int, default=100,
+                      metavar='BATCH_SIZE', help='number of images for verification')
+  parser.add_argument('--repeat', type=int, default=10,
+                      metavar='REPEAT', help='number of measurements of latency')
+  parser.add_argument('--tolerance', type=float, default=1e-3,
+                      metavar='TOLERANCE', help='allowed error of outputs')
+  parser.add_argument('--check', action='store_true', default=False,
+                      help='check the export of the network with random parameters instead of a trained model')
+  parser.add_argument('--fused', action='store_true', default=False,
+                      help='fused shake-shake units in the network of --check (shakenet only)')
+  parser.add_argument('--shake', default=None,
+                      metavar='MODE', help='mode of shake-shake units in the network of --check (shakenet only)')
+  args = parser.parse_args()
+
+  result_dir = get_result_dir(args.dataset, args.network, args.params, args.learning)
+  model_path = args.model or os.path.join(result_dir, 'bestshot.npz')
+  output_path = args.output or os.path.join(result_dir, 'inference.npz')
+
+  category, _, test_data = load_dataset(args.dataset)
+  batch = mylib.iterators.SerialIterator(test_data, args.batchsize, repeat=False, shuffle=False).next()
+  x, _ = mylib.datasets.concat_examples(batch)
+
+  if args.check:
+    network_args = {'fused': True} if args.fused else {}
+
+    if args.shake is not None:
+      network_args['shake'] = args.shake
+
+    with tempfile.TemporaryDirectory() as directory:
+      model_path = os.path.join(directory, 'bestshot.npz')
+      save_random_snapshot(model_path, create_network(args.network, category, args.params, **network_args), x)
+
+      if load_network_args(model_path, SNAPSHOT_PREFIX) != network_args:
+        raise Exception('options of the network are not saved in the model')
+
+      export(args, category, x, model_path, os.path.join(directory, 'inference.npz'))
+  else:
+    export(args, category, x, model_path, output_path)
+
+
+if __name__ == '__main__':
+  main()
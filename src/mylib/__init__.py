@@ -1,4 +1,5 @@
 from mylib import datasets
+from mylib import iterators
 from mylib import training
 from mylib import functions
 from mylib import links
@@ -1,3 +1,5 @@
 from mylib.datasets.cifar import get_cifar10
 from mylib.datasets.cifar import get_cifar100
 from mylib.datasets.mnist import get_mnist
+from mylib.datasets.batch import ExampleBatch
+from mylib.datasets.batch import concat_examples
@@ -0,0 +1,41 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from chainer import cuda
+from chainer.dataset import convert
+
+class ExampleBatch(object):
+  '''This class holds a batch as a tuple of arrays.
+  Slicing an instance returns a partial batch without copying the arrays.
+  '''
+  def __init__(self, arrays):
+    self.arrays = tuple(arrays)
+
+  def __len__(self):
+    return len(self.arrays[0])
+
+  def __getitem__(self, index):
+    if isinstance(index, slice):
+      return ExampleBatch(a[index] for a in self.arrays)
+    else:
+      return tuple(a[index] for a in self.arrays)
+
+
+def _to_device(device, x):
+  if device is None:
+    return x
+  elif device < 0:
+    return cuda.to_cpu(x)
+  else:
+    return cuda.to_gpu(x, device)
+
+
+def concat_examples(batch, device=None, padding=None):
+  '''This function converts a batch into arrays on the specified device.
+  Arrays of an `ExampleBatch` are used as they are. Other batches are
+  concatenated by `chainer.dataset.concat_examples`.
+  '''
+  if isinstance(batch, ExampleBatch):
+    return tuple(_to_device(device, a) for a in batch.arrays)
+  else:
+    return convert.concat_examples(batch, device, padding)
@@ -0,0 +1,34 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import tempfile
+import numpy
+import chainer
+
+def load_arrays(name, keys, create_arrays):
+  '''This function returns arrays stored in the dataset cache as read-only memory maps.
+  When some arrays are not stored yet, all arrays are created by `create_arrays`
+  (which returns a dict of arrays) and saved as contiguous `.npy` files.
+  Each file is written to a temporary file and renamed, so that processes
+  which build the same cache at the same time do not read incomplete files.
+  '''
+  root = chainer.dataset.get_dataset_directory(os.path.join('mylib', name))
+  paths = [os.path.join(root, '{}.npy'.format(k)) for k in keys]
+
+  if not all(os.path.isfile(p) for p in paths):
+    arrays = create_arrays()
+
+    for key, path in zip(keys, paths):
+      fd, tmppath = tempfile.mkstemp(prefix='tmp' + key, dir=root)
+
+      try:
+        with os.fdopen(fd, 'wb') as handle:
+          numpy.save(handle, numpy.ascontiguousarray(arrays[key]))
+      except Exception:
+        os.remove(tmppath)
+        raise
+
+      os.replace(tmppath, path)
+
+  return [numpy.load(p, mmap_mode='r') for p in paths]
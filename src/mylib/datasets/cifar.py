@@ -3,13 +3,17 @@
 
 import numpy
 import chainer
+from mylib.datasets.cache import load_arrays
 
 class CifarDataset(chainer.dataset.DatasetMixin):
-  def __init__(self, images, labels, pad=0, flip=False):
+  '''This dataset clips and flips images randomly.
+  If `padded` is True, `images` are regarded as already padded by `pad` pixels.
+  '''
+  def __init__(self, images, labels, pad=0, flip=False, padded=False):
     self._pad = pad
     self._flip = flip
 
-    if self._pad > 0:
+    if self._pad > 0 and not padded:
       sides = ((0, 0), (0, 0), (self._pad, self._pad), (self._pad, self._pad))
       images = numpy.pad(images, sides, 'constant', constant_values=0)
 
@@ -34,30 +38,73 @@ class CifarDataset(chainer.dataset.DatasetMixin):
 
     return image, label
 
+  def get_batch(self, indices):
+    '''This function returns images and labels of the specified examples as arrays.
+    The random clipping and flipping are applied to all images at once.
+    '''
+    indices = numpy.asarray(indices)
+    images = self._images
+    labels = self._labels[indices]
+
+    if self._pad > 0 or self._flip:
+      size = len(indices)
+      channels = images.shape[1]
+      height = images.shape[2] - self._pad * 2
+      width = images.shape[3] - self._pad * 2
+
+      r = numpy.random.randint(0, self._pad * 2 + 1, (size, 2))
+      rows = r[:, 0, numpy.newaxis] + numpy.arange(height)
+      cols = r[:, 1, numpy.newaxis] + numpy.arange(width)
+
+      if self._flip:
+        flips = numpy.random.randint(2, size=size) == 1
+        cols[flips] = cols[flips, ::-1]
+
+      images = images[indices[:, numpy.newaxis, numpy.newaxis, numpy.newaxis],
+                      numpy.arange(channels)[numpy.newaxis, :, numpy.newaxis, numpy.newaxis],
+                      rows[:, numpy.newaxis, :, numpy.newaxis],
+                      cols[:, numpy.newaxis, numpy.newaxis, :]]
+    else:
+      images = images[indices]
+
+    return images, labels
+
+
+def _get_cifar(name, get_dataset, pad):
+  def create_arrays():
+    train, test = get_dataset()
+    train_images, train_labels = train._datasets
+    test_images, test_labels = test._datasets
+
+    sides = ((0, 0), (0, 0), (pad, pad), (pad, pad))
+    train_images = numpy.pad(train_images, sides, 'constant', constant_values=0)
+
+    return {'train_images_pad{}'.format(pad): train_images, 'train_labels': train_labels,
+            'test_images': test_images, 'test_labels': test_labels}
+
+  keys = ['train_images_pad{}'.format(pad), 'train_labels', 'test_images', 'test_labels']
+  train_images, train_labels, test_images, test_labels = load_arrays(name, keys, create_arrays)
+
+  train_dataset = CifarDataset(train_images, train_labels, pad=pad, flip=True, padded=True)
+  test_dataset = CifarDataset(test_images, test_labels, pad=0, flip=False)
+
+  return train_dataset, test_dataset
+
 
 def get_cifar10():
   '''This function creates a cifar10 data set.
   All images in this data set are normalized.
   In addition, train images are augmented by random-padding-clipping and flipping.
   (This augmentation is standard of cifat10 benchmarks in 2015-2017)
+  The padded images are cached on the disk and read through memory maps.
   '''
-  train, test = chainer.datasets.cifar.get_cifar10()
-
-  train_dataset = CifarDataset(train._datasets[0], train._datasets[1], pad=4, flip=True)
-  test_dataset = CifarDataset(test._datasets[0], test._datasets[1], pad=0, flip=False)
-
-  return train_dataset, test_dataset
+  return _get_cifar('cifar10', chainer.datasets.cifar.get_cifar10, 4)
 
 
 def get_cifar100():
   '''This function creates a cifar100 data set.
   All images in this data set are normalized.
   In addition, train images are augmented by random-padding-clipping and flipping.
+  The padded images are cached on the disk and read through memory maps.
   '''
-  train, test = chainer.datasets.cifar.get_cifar100()
-
-  train_dataset = CifarDataset(train._datasets[0], train._datasets[1], pad=4, flip=True)
-  test_dataset = CifarDataset(test._datasets[0], test._datasets[1], pad=0, flip=False)
-
-  return train_dataset, test_dataset
-
+  return _get_cifar('cifar100', chainer.datasets.cifar.get_cifar100, 4)
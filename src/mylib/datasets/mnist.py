@@ -2,16 +2,26 @@
 # -*- coding: utf-8 -*-
 
 import chainer
+from mylib.datasets.cache import load_arrays
 
 def get_mnist():
-  train_data, test_data = chainer.datasets.get_mnist()
-  
-  images, labels = train_data._datasets
-  images = images.reshape(images.shape[0], 1, 28, 28)
-  train_data._datasets = (images, labels)
-    
-  images, labels = test_data._datasets
-  images = images.reshape(images.shape[0], 1, 28, 28)
-  test_data._datasets = (images, labels)
-    
+  '''This function creates a mnist data set.
+  The images are cached on the disk and read through memory maps.
+  '''
+  def create_arrays():
+    train_data, test_data = chainer.datasets.get_mnist()
+    train_images, train_labels = train_data._datasets
+    test_images, test_labels = test_data._datasets
+
+    return {'train_images': train_images.reshape(train_images.shape[0], 1, 28, 28),
+            'train_labels': train_labels,
+            'test_images': test_images.reshape(test_images.shape[0], 1, 28, 28),
+            'test_labels': test_labels}
+
+  keys = ['train_images', 'train_labels', 'test_images', 'test_labels']
+  train_images, train_labels, test_images, test_labels = load_arrays('mnist', keys, create_arrays)
+
+  train_data = chainer.datasets.TupleDataset(train_images, train_labels)
+  test_data = chainer.datasets.TupleDataset(test_images, test_labels)
+
   return train_data, test_data
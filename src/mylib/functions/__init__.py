@@ -1,2 +1,7 @@
 from mylib.functions.connection.grouped_convolution_2d import grouped_convolution_2d
 from mylib.functions.noise.shake import shake_noise
+from mylib.functions.noise.shake import split_shake_noise
+from mylib.functions.array.dense_concat import dense_concat
+from mylib.functions.util.recompute import recompute
+from mylib.functions.array.shortcut_add import shortcut_add
+from mylib.functions.array.cast import cast
@@ -0,0 +1,32 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from chainer import function
+from chainer.utils import type_check
+
+class CastFunction(function.Function):
+  '''This function converts the dtype of the input.
+  The gradient is converted back to the dtype of the input.
+  '''
+  def __init__(self, dtype):
+    self.dtype = dtype
+
+  def check_type_forward(self, in_types):
+    type_check.expect(in_types.size() == 1)
+    type_check.expect(in_types[0].dtype.kind == 'f')
+
+  def forward(self, inputs):
+    self.retain_inputs(())
+    self._in_dtype = inputs[0].dtype
+
+    return inputs[0].astype(self.dtype),
+
+  def backward(self, inputs, grad_outputs):
+    return grad_outputs[0].astype(self._in_dtype),
+
+
+def cast(x, dtype):
+  if x.dtype == dtype:
+    return x
+  else:
+    return CastFunction(dtype)(x)
@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from chainer import function
+from chainer.utils import type_check
+
+class DenseConcatFunction(function.Function):
+  '''This function concatenates `x` and `y` along the channel axis in a shared buffer.
+  The output is a view of the first channels of the buffer. When `x` is a previous output
+  of this function on the same buffer, only `y` is written and `x` is not copied.
+  The inputs are not retained, since the backward computation only needs their channels.
+  '''
+  def __init__(self, buffer, copy=False):
+    self.buffer = buffer
+    self.copy = copy
+
+  def check_type_forward(self, in_types):
+    type_check.expect(in_types.size() == 2)
+
+    x_type, y_type = in_types
+    type_check.expect(
+      x_type.dtype == y_type.dtype,
+      x_type.ndim == 4,
+      y_type.ndim == 4,
+      x_type.shape[0] == y_type.shape[0],
+      x_type.shape[2] == y_type.shape[2],
+      x_type.shape[3] == y_type.shape[3],
+    )
+
+  def forward(self, inputs):
+    self.retain_inputs(())
+
+    x, y = inputs
+    c = x.shape[1]
+    self.channels = c
+
+    if self.copy:
+      self.buffer[:, :c] = x
+
+    self.buffer[:, c:c + y.shape[1]] = y
+
+    return self.buffer[:, :c + y.shape[1]],
+
+  def backward(self, inputs, grad_outputs):
+    c = self.channels
+    g = grad_outputs[0]
+
+    return g[:, :c], g[:, c:]
+
+
+def dense_concat(x, y, buffer, copy=False):
+  return DenseConcatFunction(buffer, copy)(x, y)
@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from chainer import cuda
+from chainer import function
+from chainer.utils import type_check
+
+class ShortcutAddFunction(function.Function):
+  '''This function adds the shortcut `x` to the first channels of `y` in place.
+  If `x` has fewer channels than `y`, this is equivalent to adding `x` padded with zeros.
+  If `x` has more channels than `y`, the extra channels of `x` are ignored.
+  `y` must be a temporary output which is not used by any other function.
+  The inputs are not retained, since the backward computation only needs the shape of `x`.
+  '''
+  def check_type_forward(self, in_types):
+    type_check.expect(in_types.size() == 2)
+
+    y_type, x_type = in_types
+    type_check.expect(
+      y_type.dtype == x_type.dtype,
+      y_type.ndim == 4,
+      x_type.ndim == 4,
+      y_type.shape[0] == x_type.shape[0],
+      y_type.shape[2] == x_type.shape[2],
+      y_type.shape[3] == x_type.shape[3],
+    )
+
+  def forward(self, inputs):
+    self.retain_inputs(())
+
+    y, x = inputs
+    c = min(x.shape[1], y.shape[1])
+    self.x_shape = x.shape
+    y[:, :c] += x[:, :c]
+
+    return y,
+
+  def backward(self, inputs, grad_outputs):
+    g = grad_outputs[0]
+
+    if self.x_shape[1] <= g.shape[1]:
+      gx = g[:, :self.x_shape[1]]
+    else:
+      gx = cuda.get_array_module(g).zeros(self.x_shape, dtype=g.dtype)
+      gx[:, :g.shape[1]] = g
+
+    return g, gx
+
+
+def shortcut_add(y, x):
+  return ShortcutAddFunction()(y, x)
@@ -1,7 +1,8 @@
+import numpy
 import chainer
 from chainer import cuda
+from chainer.utils import conv
 from chainer.utils import type_check
-from chainer.functions.connection.convolution_2d import Convolution2DFunction
 
 def _pair(x):
     if hasattr(x, '__getitem__'):
@@ -12,7 +13,8 @@ def _pair(x):
 class GroupedConvolution2DFunction(chainer.Function):
   def __init__(self, stride=1, pad=0):
     super().__init__()
-    self.conv = Convolution2DFunction(stride=stride, pad=pad)
+    self.sy, self.sx = _pair(stride)
+    self.ph, self.pw = _pair(pad)
 
   def check_type_forward(self, in_types):
     n_in = in_types.size()
@@ -41,20 +43,22 @@ class GroupedConvolution2DFunction(chainer.Function):
     xp = cuda.get_array_module(*inputs)
     x, W = inputs[:2]
     b = inputs[2] if len(inputs) == 3 else None
-    y = xp.empty((W.shape[0], x.shape[0], W.shape[1], x.shape[2], x.shape[3]), dtype=x.dtype)
+    units, out_channels, in_channels, kh, kw = W.shape
 
-    c = W.shape[2]
-
-    for i in range(len(W)):
-      new_inputs = [x[:, i * c:(i + 1) * c, :], W[i]]
+    # a single im2col is shared by all groups, and the groups are computed by one batched matmul
+    if xp is numpy:
+      col = conv.im2col_cpu(x, kh, kw, self.sy, self.sx, self.ph, self.pw)
+    else:
+      col = conv.im2col_gpu(x, kh, kw, self.sy, self.sx, self.ph, self.pw)
 
-      if b is not None:
-        new_inputs.append(b[i])
+    out_h, out_w = col.shape[4:]
+    self.col = col.reshape(x.shape[0], units, in_channels * kh * kw, out_h * out_w)
 
-      y[i, :] = self.conv.forward(new_inputs)[0]
+    y = xp.matmul(W.reshape(units, out_channels, in_channels * kh * kw), self.col)
+    y = y.reshape(x.shape[0], units * out_channels, out_h, out_w)
 
-    y = xp.rollaxis(y, 1)
-    y = y.reshape(y.shape[0], y.shape[1] * y.shape[2], *y.shape[3:])
+    if b is not None:
+      y += b.reshape(1, units * out_channels, 1, 1)
 
     return y,
 
@@ -62,37 +66,33 @@ class GroupedConvolution2DFunction(chainer.Function):
     xp = cuda.get_array_module(*inputs)
     x, W = inputs[:2]
     b = inputs[2] if len(inputs) == 3 else None
-    gy = grad_outputs[0]
-    cx = W.shape[2]
-    cy = W.shape[1]
+    units, out_channels, in_channels, kh, kw = W.shape
+    out_h, out_w = grad_outputs[0].shape[2:]
 
-    gx = xp.zeros((W.shape[0], x.shape[0], W.shape[2], *x.shape[2:]), dtype=x.dtype)
-    gW = xp.zeros_like(W)
-    gb = None
+    gy = grad_outputs[0].reshape(x.shape[0], units, out_channels, out_h * out_w)
 
-    if b is not None:
-      gb = xp.zeros_like(b)
-
-    for i in range(len(W)):
-      new_inputs = [x[:, i * cx:(i + 1) * cx, :], W[i]]
-      new_grad_outputs = [gy[:, i * cy:(i + 1) * cy, :]]
+    # the gradients of the samples are accumulated one by one to avoid a temporary array of the batch size
+    gW = xp.matmul(gy[0], self.col[0].transpose(0, 2, 1))
+    gW_sample = xp.empty_like(gW)
 
-      if b is not None:
-        new_inputs.append(b[i])
+    for i in range(1, x.shape[0]):
+      xp.matmul(gy[i], self.col[i].transpose(0, 2, 1), out=gW_sample)
+      gW += gW_sample
 
-      g = self.conv.backward(new_inputs, new_grad_outputs)
-      gx[i, :] = g[0]
-      gW[i, :] = g[1]
+    gW = gW.reshape(W.shape)
 
-      if gb is not None:
-        gb[i, :] = g[2]
+    gcol = xp.matmul(W.reshape(units, out_channels, in_channels * kh * kw).transpose(0, 2, 1), gy)
+    gcol = gcol.reshape(x.shape[0], units * in_channels, kh, kw, out_h, out_w)
 
-    gx = xp.rollaxis(gx, 1)
-    gx = gx.reshape(gx.shape[0], gx.shape[1] * gx.shape[2], *gx.shape[3:])
+    if xp is numpy:
+      gx = conv.col2im_cpu(gcol, self.sy, self.sx, self.ph, self.pw, x.shape[2], x.shape[3])
+    else:
+      gx = conv.col2im_gpu(gcol, self.sy, self.sx, self.ph, self.pw, x.shape[2], x.shape[3])
 
-    if gb is None:
+    if b is None:
       return gx, gW
     else:
+      gb = gy.sum(axis=(0, 3))
       return gx, gW, gb
 
 
@@ -1,44 +1,156 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+import numpy
 from chainer import cuda
 from chainer import configuration
 from chainer import function
+from chainer.functions.array import split_axis
 from chainer.utils import type_check
 
+MODES = ('binary', 'shake-shake-image', 'shake-even', 'shake-keep')
+
+
 class ShakeNoiseFunction(function.Function):
+  '''This function mixes two inputs by per-sample coefficients: `y = a * x1 + (1 - a) * x2`.
+  The gradients are mixed by other coefficients: `g1 = b * g`, `g2 = (1 - b) * g`.
+  The coefficients depend on the mode:
+  'binary' : `a` and `b` are independently 0 or 1.
+  'shake-shake-image' : `a` and `b` are independently sampled from U(0, 1).
+  'shake-even' : `a` is sampled from U(0, 1) and `b` is 0.5.
+  'shake-keep' : `a` is sampled from U(0, 1) and `b` is `a`.
+  Both coefficients are sampled in forward from `numpy.random`,
+  so that the recomputation with the same random state gives the same result.
+  The output is written into `x1` in place, so `x1` must be a temporary output which
+  is not used by any other function (e.g. an output of batch normalization).
+  '''
+  def __init__(self, mode='binary'):
+    if mode not in MODES:
+      raise ValueError('unknown mode of shake: {}'.format(mode))
+
+    self.mode = mode
+
   def check_type_forward(self, in_types):
     type_check.expect(in_types.size() == 2)
     type_check.expect(in_types[0].dtype.kind == 'f')
     type_check.expect(in_types[1].dtype.kind == 'f')
 
+  def _sample(self, size):
+    if self.mode == 'binary':
+      a = numpy.random.randint(0, 2, size)
+      b = numpy.random.randint(0, 2, size)
+    else:
+      a = numpy.random.uniform(0, 1, size)
+
+      if self.mode == 'shake-shake-image':
+        b = numpy.random.uniform(0, 1, size)
+      elif self.mode == 'shake-even':
+        b = numpy.full(size, 0.5)
+      else:
+        b = a
+
+    return a, b
+
+  def _mix(self, x1, x2, y):
+    xp = cuda.get_array_module(x1)
+    a, b = self._sample(x1.shape[0])
+    shape = (x1.shape[0],) + (1,) * (x1.ndim - 1)
+    a = xp.asarray(a.astype(x1.dtype).reshape(shape))
+    self.b = xp.asarray(b.astype(x1.dtype).reshape(shape))
+
+    if xp is numpy:
+      numpy.subtract(x1, x2, out=y)
+      y *= a
+      y += x2
+    else:
+      cuda.elementwise(
+        'T x1, T x2, T a', 'T y',
+        'y = x2 + a * (x1 - x2)',
+        'shake_noise_fwd')(x1, x2, a, y)
+
+    return y
+
+  def _split_grad(self, g, g1, g2):
+    if cuda.get_array_module(g) is numpy:
+      numpy.multiply(g, self.b, out=g1)
+      numpy.subtract(g, g1, out=g2)
+    else:
+      cuda.elementwise(
+        'T g, T b', 'T g1, T g2',
+        'g1 = g * b; g2 = g - g1',
+        'shake_noise_bwd')(g, self.b, g1, g2)
+
   def forward(self, inputs):
-    xp = cuda.get_array_module(*inputs)
+    self.retain_inputs(())
+
     x1, x2 = inputs
 
-    mask1 = xp.random.randint(0, 2, x1.shape[0]).astype(xp.float32)
-    mask2 = 1 - mask1
+    return self._mix(x1, x2, x1),
 
-    x1 = x1 * mask1[:, xp.newaxis, xp.newaxis, xp.newaxis]
-    x2 = x2 * mask2[:, xp.newaxis, xp.newaxis, xp.newaxis]
+  def backward(self, inputs, grad):
+    xp = cuda.get_array_module(*grad)
+    g = grad[0]
 
-    return x1 + x2,
+    # `g` is not overwritten, since shortcut_add passes views of it to the shortcut.
+    # The gradients of both inputs are the same array if they are the same.
+    if self.mode == 'shake-even':
+      g1 = g * self.b
+      return g1, g1
+
+    g1 = xp.empty_like(g)
+    g2 = xp.empty_like(g)
+    self._split_grad(g, g1, g2)
+
+    return g1, g2
+
+
+class SplitShakeNoiseFunction(ShakeNoiseFunction):
+  '''This function mixes the first and the second halves of the channels of `x`
+  as `ShakeNoiseFunction` mixes `x1` and `x2`.
+  The output is written into a new array instead of a view of `x`,
+  so that `x` is released after the forward computation.
+  The gradients of both halves are written into one array in one pass.
+  '''
+  def check_type_forward(self, in_types):
+    type_check.expect(in_types.size() == 1)
+
+    x_type, = in_types
+    type_check.expect(
+      x_type.dtype.kind == 'f',
+      x_type.ndim >= 2,
+      x_type.shape[1] % 2 == 0,
+    )
+
+  def forward(self, inputs):
+    self.retain_inputs(())
 
-  def backward(self, inputs, grad):
     xp = cuda.get_array_module(*inputs)
+    x, = inputs
+    c = x.shape[1] // 2
+    y = xp.empty((x.shape[0], c) + x.shape[2:], dtype=x.dtype)
+
+    return self._mix(x[:, :c], x[:, c:], y),
+
+  def backward(self, inputs, grad):
+    xp = cuda.get_array_module(*grad)
     g = grad[0]
+    c = g.shape[1]
+    gx = xp.empty((g.shape[0], c * 2) + g.shape[2:], dtype=g.dtype)
+    self._split_grad(g, gx[:, :c], gx[:, c:])
 
-    mask1 = xp.random.randint(0, 2, g.shape[0]).astype(xp.float32)
-    mask2 = 1 - mask1
+    return gx,
 
-    g1 = g * mask1[:, xp.newaxis, xp.newaxis, xp.newaxis]
-    g2 = g * mask2[:, xp.newaxis, xp.newaxis, xp.newaxis]
 
-    return g1, g2
+def shake_noise(x1, x2, mode='binary'):
+  if configuration.config.train:
+    return ShakeNoiseFunction(mode)(x1, x2)
+  else:
+    return (x1 + x2) / 2
 
 
-def shake_noise(x1, x2):
+def split_shake_noise(x, mode='binary'):
   if configuration.config.train:
-    return ShakeNoiseFunction()(x1, x2)
+    return SplitShakeNoiseFunction(mode)(x)
   else:
+    x1, x2 = split_axis.split_axis(x, 2, axis=1)
     return (x1 + x2) / 2
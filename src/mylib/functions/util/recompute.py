@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import numpy
+import chainer
+from chainer import configuration
+from chainer import cuda
+from chainer import function
+from chainer import variable
+
+def _get_link(func):
+  if isinstance(func, chainer.Link):
+    return func
+
+  owner = getattr(func, '__self__', None)
+
+  if isinstance(owner, chainer.Link):
+    return owner
+
+  return None
+
+
+def save_persistents(link):
+  '''This function returns copies of persistent values of the link and its descendants.'''
+  values = []
+
+  if link is not None:
+    for l in link.links():
+      for name in l._persistent:
+        value = l.__dict__[name]
+
+        if isinstance(value, (numpy.ndarray, cuda.ndarray)):
+          value = value.copy()
+
+        values.append((l, name, value))
+
+  return values
+
+
+def restore_persistents(values):
+  '''This function restores persistent values returned by `save_persistents`.'''
+  for link, name, value in values:
+    current = link.__dict__[name]
+
+    if isinstance(current, (numpy.ndarray, cuda.ndarray)):
+      current[...] = value
+    else:
+      setattr(link, name, value)
+
+
+class RecomputeFunction(function.Function):
+  '''This function calls `func` without keeping its intermediate variables.
+  Only the inputs are kept, and `func` is called again in the backward computation.
+  The recomputation uses the same state of `numpy.random` as the first call,
+  and does not change the persistent values (e.g. running statistics of BatchNormalization)
+  of the link which `func` belongs to.
+  '''
+  def __init__(self, func):
+    self.func = func
+    self.link = _get_link(func)
+
+  def forward(self, inputs):
+    self.random_state = numpy.random.get_state()
+
+    with function.no_backprop_mode():
+      y = self.func(*[variable.Variable(x) for x in inputs])
+
+    return y.data,
+
+  def backward(self, inputs, grad_outputs):
+    random_state = numpy.random.get_state()
+    persistents = save_persistents(self.link)
+    numpy.random.set_state(self.random_state)
+
+    with function.force_backprop_mode():
+      xs = [variable.Variable(x) for x in inputs]
+      y = self.func(*xs)
+
+    restore_persistents(persistents)
+    numpy.random.set_state(random_state)
+
+    y.grad = grad_outputs[0]
+    y.backward()
+
+    return tuple(x.grad for x in xs)
+
+
+def recompute(func, *xs):
+  '''This function calls `func` which is recomputed in the backward computation.
+  If `func` is a link or a method of a link, its persistent values are kept
+  through the recomputation.
+  '''
+  if not configuration.config.enable_backprop:
+    return func(*xs)
+
+  return RecomputeFunction(func)(*xs)
@@ -0,0 +1,2 @@
+from mylib.iterators.serial_iterator import SerialIterator
+from mylib.iterators.multiprocess_iterator import MultiprocessIterator
@@ -0,0 +1,224 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import collections
+import multiprocessing
+import multiprocessing.sharedctypes
+import traceback
+import numpy
+import chainer
+from chainer.dataset import convert
+from mylib.datasets.batch import ExampleBatch
+
+def _create_arrays(buffers, shapes, dtypes):
+  return [numpy.frombuffer(b, dtype=d).reshape(s) for b, s, d in zip(buffers, shapes, dtypes)]
+
+
+def _load_batches(dataset, buffers, shapes, dtypes, tasks, results):
+  arrays = [_create_arrays(b, shapes, dtypes) for b in buffers]
+
+  while True:
+    task = tasks.get()
+
+    if task is None:
+      break
+
+    slot, indices, seed = task
+
+    try:
+      numpy.random.seed(seed)
+
+      if hasattr(dataset, 'get_batch'):
+        batch = dataset.get_batch(indices)
+      else:
+        batch = convert.concat_examples([dataset[i] for i in indices])
+
+      for array, value in zip(arrays[slot], batch):
+        array[:len(indices)] = value
+
+      results.put((slot, None))
+    except Exception:
+      results.put((slot, traceback.format_exc()))
+
+
+class MultiprocessIterator(chainer.dataset.Iterator):
+  '''This iterator loads batches in worker processes.
+  Workers write examples into shared memory buffers which are allocated in advance,
+  so that images are not pickled between processes. The order of examples and
+  the random augmentation of each batch are determined by the seed, the epoch and
+  the position of the batch, which does not depend on the number of workers.
+  A returned batch is a view of the shared buffer and is valid until the next call.
+  '''
+  def __init__(self, dataset, batch_size, repeat=True, shuffle=True,
+               n_processes=None, n_prefetch=2, seed=None):
+    self.dataset = dataset
+    self.batch_size = batch_size
+    self._repeat = repeat
+    self._shuffle = shuffle
+    self.n_processes = n_processes or multiprocessing.cpu_count()
+    self.n_prefetch = max(n_prefetch, 1)
+    self._seed = numpy.random.randint(2 ** 31) if seed is None else seed
+
+    self.current_position = 0
+    self.epoch = 0
+    self.is_new_epoch = False
+    self._previous_epoch_detail = -1.
+
+    self._orders = {}
+    self._processes = None
+
+  def __next__(self):
+    if self._processes is None:
+      self._start()
+
+    if self._returned is not None:
+      self._free.append(self._returned)
+      self._returned = None
+
+    self._prefetch()
+
+    if len(self._tasks) == 0:
+      raise StopIteration
+
+    slot, size, state = self._tasks.popleft()
+
+    while slot not in self._done:
+      self._receive()
+
+    self._done.remove(slot)
+    self._returned = slot
+
+    self._previous_epoch_detail = self.epoch_detail
+    self.epoch, self.current_position, self.is_new_epoch = state
+
+    return ExampleBatch(a[:size] for a in self._arrays[slot])
+
+  next = __next__
+
+  @property
+  def epoch_detail(self):
+    return self.epoch + self.current_position / len(self.dataset)
+
+  @property
+  def previous_epoch_detail(self):
+    if self._previous_epoch_detail < 0:
+      return None
+    return self._previous_epoch_detail
+
+  def serialize(self, serializer):
+    self.current_position = int(serializer('current_position', self.current_position))
+    self.epoch = int(serializer('epoch', self.epoch))
+    self.is_new_epoch = bool(serializer('is_new_epoch', self.is_new_epoch))
+
+    try:
+      self._seed = int(serializer('seed', self._seed))
+      self._previous_epoch_detail = float(serializer('previous_epoch_detail', self._previous_epoch_detail))
+    except KeyError:
+      pass
+
+    if isinstance(serializer, chainer.serializer.Deserializer) and self._processes is not None:
+      self._reset()
+
+  def finalize(self):
+    if self._processes is None:
+      return
+
+    for _ in self._processes:
+      self._task_queue.put(None)
+
+    for process in self._processes:
+      process.join()
+
+    self._processes = None
+
+  def _start(self):
+    example = self.dataset[0]
+    shapes = [(self.batch_size,) + numpy.asarray(v).shape for v in example]
+    dtypes = [numpy.asarray(v).dtype for v in example]
+    buffers = []
+
+    for _ in range(self.n_prefetch + 1):
+      sizes = [int(numpy.prod(s)) * d.itemsize for s, d in zip(shapes, dtypes)]
+      buffers.append([multiprocessing.sharedctypes.RawArray('b', n) for n in sizes])
+
+    self._arrays = [_create_arrays(b, shapes, dtypes) for b in buffers]
+    self._task_queue = multiprocessing.Queue()
+    self._result_queue = multiprocessing.Queue()
+    self._processes = []
+
+    for _ in range(self.n_processes):
+      args = (self.dataset, buffers, shapes, dtypes, self._task_queue, self._result_queue)
+      process = multiprocessing.Process(target=_load_batches, args=args)
+      process.daemon = True
+      process.start()
+      self._processes.append(process)
+
+    self._tasks = collections.deque()
+    self._free = list(range(len(buffers)))
+    self._done = set()
+    self._pending = 0
+    self._returned = None
+    self._issued = (self.epoch, self.current_position, self.is_new_epoch)
+
+  def _reset(self):
+    while self._pending > 0:
+      self._receive()
+
+    self._tasks.clear()
+    self._free = list(range(len(self._arrays)))
+    self._done.clear()
+    self._returned = None
+    self._issued = (self.epoch, self.current_position, self.is_new_epoch)
+
+  def _receive(self):
+    slot, error = self._result_queue.get()
+    self._pending -= 1
+
+    if error is not None:
+      raise RuntimeError('failed to load a batch:\n{}'.format(error))
+
+    self._done.add(slot)
+
+  def _prefetch(self):
+    while len(self._tasks) < self.n_prefetch and len(self._free) != 0:
+      epoch, position, _ = self._issued
+
+      if not self._repeat and epoch > 0:
+        break
+
+      indices, state = self._get_indices(epoch, position)
+      slot = self._free.pop()
+
+      self._task_queue.put((slot, indices, (self._seed, epoch, position)))
+      self._tasks.append((slot, len(indices), state))
+      self._pending += 1
+      self._issued = state
+
+  def _get_indices(self, epoch, position):
+    N = len(self.dataset)
+    position_end = position + self.batch_size
+    indices = self._get_order(epoch)[position:position_end]
+
+    if position_end < N:
+      return indices, (epoch, position_end, False)
+    elif not self._repeat:
+      return indices, (epoch + 1, 0, True)
+
+    rest = position_end - N
+
+    if rest > 0:
+      indices = numpy.concatenate((indices, self._get_order(epoch + 1)[:rest]))
+
+    return indices, (epoch + 1, rest, True)
+
+  def _get_order(self, epoch):
+    if epoch not in self._orders:
+      if self._shuffle:
+        order = numpy.random.RandomState((self._seed, epoch)).permutation(len(self.dataset))
+      else:
+        order = numpy.arange(len(self.dataset))
+
+      self._orders = {k: v for k, v in self._orders.items() if k >= epoch - 1}
+      self._orders[epoch] = order
+
+    return self._orders[epoch]
@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import numpy
+import chainer
+from mylib.datasets.batch import ExampleBatch
+
+class SerialIterator(chainer.iterators.SerialIterator):
+  '''This iterator returns a batch as an `ExampleBatch`.
+  When the dataset has `get_batch`, all examples of a batch are created by one call of it.
+  Otherwise, the examples are retrieved one by one like `chainer.iterators.SerialIterator`.
+  '''
+  def __next__(self):
+    if not self._repeat and self.epoch > 0:
+      raise StopIteration
+
+    self._previous_epoch_detail = self.epoch_detail
+
+    i = self.current_position
+    i_end = i + self.batch_size
+    N = len(self.dataset)
+
+    if self._order is None:
+      indices = numpy.arange(i, min(i_end, N))
+    else:
+      indices = self._order[i:i_end].copy()
+
+    if i_end >= N:
+      if self._repeat:
+        rest = i_end - N
+
+        if self._order is not None:
+          numpy.random.shuffle(self._order)
+
+        if rest > 0:
+          if self._order is None:
+            indices = numpy.concatenate((indices, numpy.arange(rest)))
+          else:
+            indices = numpy.concatenate((indices, self._order[:rest]))
+
+        self.current_position = rest
+      else:
+        self.current_position = 0
+
+      self.epoch += 1
+      self.is_new_epoch = True
+    else:
+      self.is_new_epoch = False
+      self.current_position = i_end
+
+    return self._get_batch(indices)
+
+  next = __next__
+
+  def _get_batch(self, indices):
+    if hasattr(self.dataset, 'get_batch'):
+      return ExampleBatch(self.dataset.get_batch(indices))
+    else:
+      return [self.dataset[index] for index in indices]
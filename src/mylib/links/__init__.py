@@ -1 +1,2 @@
 from mylib.links.connection.grouped_convolution_2d import GroupedConvolution2D
+from mylib.links.normalization.batch_normalization import BatchNormalization
@@ -0,0 +1,18 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import chainer
+from mylib.functions import cast
+
+class BatchNormalization(chainer.links.BatchNormalization):
+  '''Batch normalization which always computes in the dtype of its parameters.
+  Inputs of other dtypes (e.g. float16) are converted before the normalization and
+  the outputs are converted back, so that the statistics are kept in float32.
+  '''
+  def __call__(self, x, *args, **kwargs):
+    dtype = x.dtype
+
+    if dtype == self.avg_mean.dtype:
+      return super().__call__(x, *args, **kwargs)
+    else:
+      return cast(super().__call__(cast(x, self.avg_mean.dtype), *args, **kwargs), dtype)
@@ -1,4 +1,5 @@
 from mylib.training import extensions
 from mylib.training import trigger
 
-from mylib.training.updater import StandardUpdater
\ No newline at end of file
+from mylib.training.updater import StandardUpdater
+from mylib.training.multiprocess_updater import MultiprocessUpdater
\ No newline at end of file
@@ -1,10 +1,19 @@
 from mylib.training.extensions.log_report import LogReport
-from mylib.training.extensions.plot_report import PlotReport
 from mylib.training.extensions.print_report import PrintReport
 
+from mylib.training.extensions.async_writer import AsyncWriter
 from mylib.training.extensions.bestshot import Bestshot
-from mylib.training.extensions.computational_graph import dump_graph
+from mylib.training.extensions.snapshot import Snapshot
+from mylib.training.extensions.successive_halving import HalvingCoordinator, SuccessiveHalving
 from mylib.training.extensions.network_size import dump_network_size
+from mylib.training.extensions.function_profile import FunctionProfile
+from mylib.training.extensions.memory_usage import MemoryUsage
+from mylib.training.extensions.startup_time import StartupTime
+
+from mylib.training.extensions.evaluator import Evaluator
 
 from mylib.training.extensions.cosine_shift import CosineShift
-from mylib.training.extensions.step_shift import StepShift
\ No newline at end of file
+from mylib.training.extensions.step_shift import StepShift
+
+# PlotReport (plot_report), dump_graph (computational_graph) and NetworkGraph (network_graph) are not
+# imported here, since they load matplotlib and the graph dumper. Import their modules when they are used.
\ No newline at end of file
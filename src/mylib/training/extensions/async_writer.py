@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import tempfile
+import threading
+import numpy
+from chainer.serializers import npz
+
+class AsyncWriter(object):
+  '''This class writes snapshots in the npz format in a background thread.
+  The target is serialized into copies of its arrays on the host in the calling thread,
+  and the copies are compressed and written to a temporary file, which is renamed
+  to the destination atomically. Each writer writes at most one file at a time; a new write
+  waits for the previous one, so a writer should be used for one file (e.g. one extension)
+  and writes of different files should use different writers. Errors of the background
+  thread are raised by `wait`.
+  '''
+  def __init__(self):
+    self._thread = None
+    self._error = None
+
+  def write(self, path, target):
+    serializer = npz.DictionarySerializer()
+    serializer.save(target)
+    arrays = {k: numpy.array(v) for k, v in serializer.target.items()}
+
+    self.wait()
+
+    self._thread = threading.Thread(target=self._write, args=(path, arrays))
+    self._thread.daemon = True
+    self._thread.start()
+
+  def _write(self, path, arrays):
+    directory, filename = os.path.split(path)
+    fd, tmppath = tempfile.mkstemp(prefix='tmp' + filename, dir=directory)
+
+    try:
+      with os.fdopen(fd, 'wb') as handle:
+        numpy.savez_compressed(handle, **arrays)
+
+      os.replace(tmppath, path)
+    except Exception as e:
+      self._error = e
+
+      if os.path.exists(tmppath):
+        os.remove(tmppath)
+
+  def wait(self):
+    '''waits for the file being written'''
+    if self._thread is not None:
+      self._thread.join()
+      self._thread = None
+
+    if self._error is not None:
+      error, self._error = self._error, None
+      raise error
@@ -11,8 +11,9 @@ from chainer.serializers import npz
 
 class Bestshot(chainer.training.extension.Extension):
   def __init__(self, savefun=npz.save_npz, filename='bestshot.npz', trigger=(1, 'epoch'),
-               key='validation/main/accuracy', comp='max'):
+               key='validation/main/accuracy', comp='max', writer=None):
     self._savefun = savefun
+    self._writer = writer
     self._filename = filename
     self._trigger = chainer.training.trigger.get_trigger(trigger)
     self._key = key
@@ -32,16 +33,24 @@ class Bestshot(chainer.training.extension.Extension):
 
     if self._trigger(trainer):
       stats = self._summary.compute_mean()
-      value = float(stats[self._key])
 
-      if self._value is None or self._comp(value, self._value) > 0:
-        self._value = value
-        self._save(trainer)
+      # the key is missing in epochs without evaluation
+      if self._key in stats:
+        value = float(stats[self._key])
+
+        if self._value is None or self._comp(value, self._value) > 0:
+          self._value = value
+          self._save(trainer)
 
       self._init_summary()
 
   def _save(self, trainer):
     filename = self._filename.format(trainer)
+
+    if self._writer is not None:
+      self._writer.write(os.path.join(trainer.out, filename), trainer)
+      return
+
     prefix = 'tmp' + filename
 
     fd, tmppath = tempfile.mkstemp(prefix=prefix, dir=trainer.out)
@@ -56,6 +65,10 @@ class Bestshot(chainer.training.extension.Extension):
     os.close(fd)
     shutil.move(tmppath, os.path.join(trainer.out, filename))
 
+  def finalize(self):
+    if self._writer is not None:
+      self._writer.wait()
+
   def serialize(self, serializer):
     self._value = json.loads(serializer('value', json.dumps(self._value)))
     self._trigger.serialize(serializer['trigger'])
@@ -21,6 +21,19 @@ class CosineShift(chainer.training.extension.Extension):
   def __call__(self, trainer):
     self._update_value(trainer)
 
+  def get_cycle_ends(self, limit):
+    '''returns the epochs at the ends of cycles before the limit'''
+    ends = []
+    period_range = self._period
+    period_end = period_range
+
+    while period_end < limit:
+      ends.append(period_end)
+      period_range *= self._period_mult
+      period_end += period_range
+
+    return ends
+
   def _update_value(self, trainer):
     optimizer = self._optimizer or trainer.updater.get_optimizer('main')
     epoch = trainer.updater.epoch
@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import numpy
+import chainer
+from chainer import cuda
+from mylib.datasets import concat_examples
+
+class Evaluator(chainer.training.extension.Extension):
+  '''This extension evaluates the loss and the accuracy of a classifier by its `lossfun` and `accfun`
+  (softmax cross entropy and accuracy if the target does not have them).
+  The examples are loaded from the dataset once and kept as arrays on the host, and each batch
+  is a view of them (or a copy into a preallocated buffer on GPU). The predictor is called with
+  backprop disabled, and the loss and the accuracy weighted by the batch sizes are accumulated on the device
+  without the reporter, so that the device is synchronized only once per evaluation.
+  If `samples` is given, a fixed subset of the dataset selected by `seed` is evaluated
+  (a random subset if `seed` is None).
+  Results are reported as `{name}/main/loss` and `{name}/main/accuracy`.
+  '''
+  trigger = 1, 'epoch'
+  default_name = 'validation'
+  priority = chainer.training.extension.PRIORITY_WRITER
+
+  def __init__(self, dataset, target, batchsize=100, device=None, samples=None, seed=None):
+    self._dataset = dataset
+    self._target = target
+    self._batchsize = batchsize
+    self._device = device
+    self._samples = samples
+    self._seed = seed
+    self._arrays = None
+    self._buffers = None
+
+  def _load(self):
+    indices = numpy.arange(len(self._dataset))
+
+    if self._samples is not None and self._samples < len(indices):
+      indices = numpy.sort(numpy.random.RandomState(self._seed).permutation(indices)[:self._samples])
+
+    if hasattr(self._dataset, 'get_batch'):
+      x, t = self._dataset.get_batch(indices)
+    else:
+      x, t = concat_examples([self._dataset[i] for i in indices])
+
+    self._arrays = (numpy.ascontiguousarray(x), numpy.ascontiguousarray(t))
+
+    if self._device is not None and self._device >= 0:
+      with cuda.get_device(self._device):
+        self._buffers = tuple(cuda.cupy.empty((self._batchsize,) + a.shape[1:], dtype=a.dtype)
+                              for a in self._arrays)
+
+  def _batches(self):
+    x, t = self._arrays
+
+    for start in range(0, len(x), self._batchsize):
+      end = min(start + self._batchsize, len(x))
+
+      if self._buffers is None:
+        yield x[start:end], t[start:end]
+      else:
+        x_buffer, t_buffer = self._buffers
+        x_buffer[:end - start].set(x[start:end])
+        t_buffer[:end - start].set(t[start:end])
+
+        yield x_buffer[:end - start], t_buffer[:end - start]
+
+  def evaluate(self):
+    '''returns the mean loss and the accuracy'''
+    if self._arrays is None:
+      self._load()
+
+    predictor = getattr(self._target, 'predictor', self._target)
+    lossfun = getattr(self._target, 'lossfun', chainer.functions.softmax_cross_entropy)
+    accfun = getattr(self._target, 'accfun', chainer.functions.accuracy)
+    total_loss = 0
+    total_accuracy = 0
+
+    with chainer.using_config('train', False), chainer.no_backprop_mode():
+      for x, t in self._batches():
+        y = predictor(x)
+
+        total_loss += lossfun(y, t).data * len(t)
+        total_accuracy += accfun(y, t).data * len(t)
+
+    count = len(self._arrays[1])
+
+    return float(total_loss) / count, float(total_accuracy) / count
+
+  def __call__(self, trainer=None):
+    loss, accuracy = self.evaluate()
+    name = getattr(self, 'name', self.default_name)
+    result = {'{}/main/loss'.format(name): loss, '{}/main/accuracy'.format(name): accuracy}
+
+    chainer.reporter.report(result)
+
+    return result
@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import collections
+import json
+import os
+import time
+import numpy
+import chainer
+from chainer import cuda
+from mylib.training.extensions.link_path import LinkPathTracker
+
+class _ProfileHook(chainer.function.FunctionHook):
+  name = 'FunctionProfile'
+
+  def __init__(self, tracker):
+    self.tracker = tracker
+    self.records = collections.OrderedDict()
+    self._starts = {}
+
+  def forward_preprocess(self, function, in_data):
+    function._profile_path = self.tracker.path
+    self._start(function, in_data)
+
+  def forward_postprocess(self, function, in_data):
+    self._stop('forward', function, in_data)
+
+  def backward_preprocess(self, function, in_data, out_grad):
+    self._start(function, in_data)
+
+  def backward_postprocess(self, function, in_data, out_grad):
+    self._stop('backward', function, in_data)
+
+  def _start(self, function, in_data):
+    self._synchronize(in_data)
+    self._starts[id(function)] = time.perf_counter()
+
+  def _stop(self, phase, function, in_data):
+    self._synchronize(in_data)
+    elapsed = time.perf_counter() - self._starts.pop(id(function))
+
+    key = (phase, type(function).__name__, getattr(function, '_profile_path', '/'))
+    record = self.records.setdefault(key, [0, 0.0])
+    record[0] += 1
+    record[1] += elapsed
+
+  def _synchronize(self, in_data):
+    if cuda.get_array_module(*in_data) is not numpy:
+      cuda.Stream.null.synchronize()
+
+
+class FunctionProfile(chainer.training.extension.Extension):
+  '''This extension measures the elapsed time and the number of calls of functions
+  for each phase (forward/backward), each function type and each link path.
+  The accumulated results are written to `{filename}.txt` and `{filename}.json`
+  in the output directory of the trainer.
+  The hooks are installed only while this extension is active.
+  If the updater computes on a working copy of the target (`model` of `StandardUpdater` with float16),
+  the links of the copy are tracked after it is created in the first iteration, and the records
+  of the first iteration are discarded. Functions computed in other processes (e.g. by
+  `MultiprocessUpdater`) are not measured, so the extension cannot be used with such an updater.
+  '''
+  trigger = 1, 'iteration'
+
+  def __init__(self, filename='profile', trigger=(100, 'iteration')):
+    self._filename = filename
+    self._trigger = chainer.training.trigger.get_trigger(trigger)
+    self._tracker = None
+    self._hook = None
+    self._model = None
+
+  def initialize(self, trainer):
+    if getattr(trainer.updater, 'n_processes', 1) > 1:
+      raise ValueError('FunctionProfile cannot measure functions computed in other processes')
+
+    self._model = self._get_model(trainer)
+    self._tracker = LinkPathTracker(self._model).__enter__()
+    self._hook = _ProfileHook(self._tracker).__enter__()
+    self._out = trainer.out
+    self._iteration = trainer.updater.iteration
+
+  def __call__(self, trainer):
+    model = self._get_model(trainer)
+
+    # track the working copy created in the first iteration
+    if model is not self._model:
+      self._model = model
+      self._tracker.__exit__(None, None, None)
+      self._tracker = LinkPathTracker(model).__enter__()
+      self._hook.tracker = self._tracker
+      self._hook.records.clear()
+
+    self._iteration = trainer.updater.iteration
+
+    if self._trigger(trainer):
+      self._write()
+
+  def finalize(self):
+    if self._hook is None:
+      return
+
+    self._hook.__exit__(None, None, None)
+    self._tracker.__exit__(None, None, None)
+    self._write()
+    self._hook = None
+    self._tracker = None
+
+  def _get_model(self, trainer):
+    model = getattr(trainer.updater, 'model', None)
+
+    if model is None:
+      model = trainer.updater.get_optimizer('main').target
+
+    return getattr(model, 'predictor', model)
+
+  def _write(self):
+    records = [{'phase': k[0], 'function': k[1], 'path': k[2], 'calls': v[0], 'time': v[1]}
+               for k, v in self._hook.records.items()]
+    records.sort(key=lambda x: x['time'], reverse=True)
+
+    totals = collections.OrderedDict()
+
+    for record in records:
+      total = totals.setdefault((record['phase'], record['function']), [0, 0.0])
+      total[0] += record['calls']
+      total[1] += record['time']
+
+    functions = [{'phase': k[0], 'function': k[1], 'calls': v[0], 'time': v[1]} for k, v in totals.items()]
+    functions.sort(key=lambda x: x['time'], reverse=True)
+
+    with open(os.path.join(self._out, '{}.json'.format(self._filename)), 'w') as handle:
+      json.dump({'iteration': self._iteration, 'functions': functions, 'links': records}, handle, indent=4)
+
+    with open(os.path.join(self._out, '{}.txt'.format(self._filename)), 'w') as handle:
+      total_time = sum(v['time'] for v in functions) or 1.0
+
+      handle.write('iteration: {}\n\n'.format(self._iteration))
+      handle.write('{:<9} {:<36} {:>10} {:>12} {:>7}\n'.format('phase', 'function', 'calls', 'time(ms)', 'ratio'))
+
+      for v in functions:
+        handle.write('{:<9} {:<36} {:>10} {:>12.1f} {:>6.1f}%\n'.format(
+          v['phase'], v['function'], v['calls'], v['time'] * 1000, v['time'] / total_time * 100))
+
+      handle.write('\n{:<9} {:<36} {:<28} {:>10} {:>12}\n'.format('phase', 'function', 'link', 'calls', 'time(ms)'))
+
+      for v in records:
+        handle.write('{:<9} {:<36} {:<28} {:>10} {:>12.1f}\n'.format(
+          v['phase'], v['function'], v['path'], v['calls'], v['time'] * 1000))
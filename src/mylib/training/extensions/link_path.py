@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# trackers which are entered, and the original `__call__` and the number of the trackers of each wrapped class
+_trackers = []
+_wrapped = {}
+
+
+def _wrap(call):
+  def __call__(self, *args, **kwargs):
+    trackers = [t for t in _trackers if id(self) in t.paths]
+
+    if len(trackers) == 0:
+      return call(self, *args, **kwargs)
+
+    for tracker in trackers:
+      tracker.stack.append(tracker.paths[id(self)])
+
+    try:
+      return call(self, *args, **kwargs)
+    finally:
+      for tracker in trackers:
+        tracker.stack.pop()
+
+  return __call__
+
+
+class LinkPathTracker(object):
+  '''This class tracks the path of the link which is being called (e.g. `/block2/3/conv1`).
+  While it is entered, `__call__` of the classes of the links in the model are replaced
+  with wrappers which push the path of the called link. The wrappers are shared by the trackers
+  which are entered at the same time (e.g. by several extensions), and the original methods
+  are restored when the last of them exits, so there is no overhead outside of them.
+  '''
+  def __init__(self, model):
+    self.model = model
+    self.paths = {}
+    self.stack = []
+    self._classes = []
+
+  @property
+  def path(self):
+    return self.stack[-1] if len(self.stack) != 0 else '/'
+
+  def __enter__(self):
+    self.paths = {id(link): path for path, link in self.model.namedlinks(skipself=True)}
+    self._classes = list(set(type(link) for link in self.model.links(skipself=True)))
+
+    for cls in self._classes:
+      if cls in _wrapped:
+        _wrapped[cls][1] += 1
+      else:
+        _wrapped[cls] = [cls.__dict__.get('__call__'), 1]
+        cls.__call__ = _wrap(cls.__call__)
+
+    _trackers.append(self)
+
+    return self
+
+  def __exit__(self, *_):
+    if self not in _trackers:
+      return
+
+    _trackers.remove(self)
+
+    for cls in self._classes:
+      _wrapped[cls][1] -= 1
+
+      if _wrapped[cls][1] == 0:
+        call = _wrapped.pop(cls)[0]
+
+        if call is None:
+          del cls.__call__
+        else:
+          cls.__call__ = call
+
+    self._classes = []
+    self.stack = []
@@ -1,9 +1,114 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
-from chainer.training import extensions
+import os
+import json
+import tempfile
+import chainer
+
+class LogReport(chainer.training.extension.Extension):
+  '''This extension accumulates the observations and writes the mean of them as a log (the same as
+  `chainer.training.extensions.LogReport`, which is not imported so that matplotlib is not loaded).
+  If `log_format` is 'jsonl', a new entry is appended to the log file as a line instead of
+  rewriting the whole list. The file is rewritten only at the first output after the start
+  (or the resume) of the training, and it is synchronized to the disk every `fsync_interval` entries.
+  '''
+  def __init__(self, keys=None, trigger=(1, 'epoch'), postprocess=None, log_name='log',
+               log_format='json', fsync_interval=10):
+    self._keys = keys
+    self._trigger = chainer.training.trigger.get_trigger(trigger)
+    self._postprocess = postprocess
+    self._log = []
+
+    if log_format == 'jsonl':
+      self._log_name = None
+      self._stream_name = log_name
+    else:
+      self._log_name = log_name
+      self._stream_name = None
+
+    self._fsync_interval = fsync_interval
+    self._stream = None
+    self._unsynced = 0
+
+    self._init_summary()
+
+  @property
+  def log(self):
+    return self._log
+
+  def __call__(self, trainer):
+    if self._keys is None:
+      self._summary.add(trainer.observation)
+    else:
+      self._summary.add({k: trainer.observation[k] for k in self._keys if k in trainer.observation})
+
+    if not self._trigger(trainer):
+      return
+
+    entry = {k: float(v) for k, v in self._summary.compute_mean().items()}
+    entry['epoch'] = trainer.updater.epoch
+    entry['iteration'] = trainer.updater.iteration
+    entry['elapsed_time'] = trainer.elapsed_time
+
+    if self._postprocess is not None:
+      self._postprocess(entry)
+
+    self._log.append(entry)
+    self._init_summary()
+
+    if self._log_name is not None:
+      fd, tmppath = tempfile.mkstemp(prefix=self._log_name, dir=trainer.out)
+
+      with os.fdopen(fd, 'w') as handle:
+        json.dump(self._log, handle, indent=4)
+
+      os.replace(tmppath, os.path.join(trainer.out, self._log_name))
+    else:
+      self._write(trainer, [entry])
+
+  def _init_summary(self):
+    self._summary = chainer.reporter.DictSummary()
+
+  def _write(self, trainer, entries):
+    if self._stream is None:
+      path = os.path.join(trainer.out, self._stream_name)
+      fd, tmppath = tempfile.mkstemp(prefix=self._stream_name, dir=trainer.out)
+
+      with os.fdopen(fd, 'w') as handle:
+        for entry in self._log:
+          handle.write(json.dumps(entry) + '\n')
+
+      os.replace(tmppath, path)
+
+      self._stream = open(path, 'a')
+      self._unsynced = 0
+    else:
+      for entry in entries:
+        self._stream.write(json.dumps(entry) + '\n')
+
+      self._unsynced += len(entries)
+
+    self._stream.flush()
+
+    if self._unsynced >= self._fsync_interval:
+      self._sync()
+
+  def _sync(self):
+    os.fsync(self._stream.fileno())
+    self._unsynced = 0
+
+  def finalize(self):
+    if self._stream is not None:
+      self._stream.flush()
+      self._sync()
+      self._stream.close()
+      self._stream = None
 
-class LogReport(extensions.LogReport):
   def serialize(self, serializer):
-    super().serialize(serializer)
     self._trigger.serialize(serializer['_trigger'])
+
+    if isinstance(serializer, chainer.serializer.Serializer):
+      serializer('_log', json.dumps(self._log))
+    else:
+      self._log = json.loads(serializer('_log', ''))
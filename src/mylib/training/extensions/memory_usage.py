@@ -0,0 +1,179 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import collections
+import os
+import tracemalloc
+import chainer
+from chainer import configuration
+from mylib.training.extensions.link_path import LinkPathTracker
+
+def _nbytes(arrays):
+  return sum(a.nbytes for a in arrays if a is not None)
+
+
+class _MemoryHook(chainer.function.FunctionHook):
+  name = 'MemoryUsage'
+
+  def __init__(self, tracker, ignored):
+    self.tracker = tracker
+    self.ignored = ignored
+    self.records = {}
+    self._functions = []
+
+  def forward_preprocess(self, function, in_data):
+    function._memory_path = self.tracker.path
+
+  def forward_postprocess(self, function, in_data):
+    if not configuration.config.enable_backprop:
+      return
+
+    indexes = getattr(function, '_input_indexes_to_retain', None)
+
+    if indexes is None:
+      indexes = range(len(in_data))
+
+    self._functions.append((function, [in_data[i] for i in indexes]))
+
+  def backward_preprocess(self, function, in_data, out_grad):
+    self.count()
+
+  def count(self):
+    '''counts the bytes of arrays retained for backward by the functions called since the last count'''
+    if len(self._functions) == 0:
+      return
+
+    counted = set(self.ignored)
+    records = collections.defaultdict(int)
+
+    for function, inputs in self._functions:
+      arrays = list(inputs) + list(getattr(function, 'output_data', None) or [])
+
+      for array in arrays:
+        if array is None or id(array) in counted:
+          continue
+
+        counted.add(id(array))
+        records[function._memory_path] += array.nbytes
+
+    for path, size in records.items():
+      self.records[path] = max(self.records.get(path, 0), size)
+
+    self._functions = []
+
+
+class MemoryUsage(chainer.training.extension.Extension):
+  '''This extension records the memory usage of `iterations` iterations after the first one.
+  The measurement starts at the end of the first iteration of the process, after the lazy parameters
+  and the working copy of the updater are created.
+  The bytes of arrays retained for backward (activations) are counted for each link path,
+  where an array is counted only once at the first function which retains it.
+  The peak of memory allocated in each iteration is measured by `tracemalloc` (CPU only),
+  and the bytes of parameters, gradients and states of the optimizer are also recorded.
+  If the updater computes on a working copy of the target (`model` of `StandardUpdater` with float16),
+  the activations of the copy are counted, and its parameters and gradients are also recorded.
+  Memory of other processes (e.g. the workers of `MultiprocessUpdater`) is not measured,
+  so the extension cannot be used with such an updater.
+  The results are written to `filename` in the output directory of the trainer.
+  '''
+  trigger = 1, 'iteration'
+
+  def __init__(self, filename='memory.txt', iterations=3):
+    self._filename = filename
+    self._iterations = iterations
+    self._tracker = None
+    self._hook = None
+    self._peaks = []
+    self._written = False
+
+  def initialize(self, trainer):
+    if getattr(trainer.updater, 'n_processes', 1) > 1:
+      raise ValueError('MemoryUsage cannot measure memory of other processes')
+
+  def _start(self, trainer):
+    target = trainer.updater.get_optimizer('main').target
+    copy = getattr(trainer.updater, 'model', None)
+    model = target if copy is None else copy
+    model = getattr(model, 'predictor', model)
+    ignored = [id(p.data) for p in target.params()]
+
+    if copy is not None:
+      ignored += [id(p.data) for p in copy.params()]
+
+    self._tracker = LinkPathTracker(model).__enter__()
+    self._hook = _MemoryHook(self._tracker, ignored).__enter__()
+    self._tracing = tracemalloc.is_tracing()
+
+    if not self._tracing:
+      tracemalloc.start()
+
+    self._reset_peak()
+
+  def __call__(self, trainer):
+    if self._written:
+      return
+
+    if self._hook is None:
+      self._start(trainer)
+      return
+
+    self._hook.count()
+    self._peaks.append(tracemalloc.get_traced_memory()[1])
+    self._reset_peak()
+
+    if len(self._peaks) >= self._iterations:
+      self._write(trainer)
+      self._written = True
+      self.finalize()
+
+  def finalize(self):
+    if self._hook is None:
+      return
+
+    self._hook.__exit__(None, None, None)
+    self._tracker.__exit__(None, None, None)
+
+    if not self._tracing:
+      tracemalloc.stop()
+
+    self._hook = None
+    self._tracker = None
+
+  def _reset_peak(self):
+    if hasattr(tracemalloc, 'reset_peak'):
+      tracemalloc.reset_peak()
+    else:
+      tracemalloc.clear_traces()
+
+  def _write(self, trainer):
+    optimizer = trainer.updater.get_optimizer('main')
+    params = list(optimizer.target.params())
+    states = [v for p in params if p.update_rule is not None for v in p.update_rule.state.values()]
+
+    memory = collections.defaultdict(int)
+
+    for path, size in self._hook.records.items():
+      names = path.split('/')
+      names = ['/'] + ['/'.join(names[:i + 1]) for i in range(1, len(names)) if names[i]]
+
+      for name in names:
+        memory[name] += size
+
+    with open(os.path.join(trainer.out, self._filename), 'w') as handle:
+      handle.write('peak: {}\n'.format(max(self._peaks)))
+
+      for i, peak in enumerate(self._peaks):
+        handle.write('peak/{}: {}\n'.format(i + 1, peak))
+
+      handle.write('parameters: {}\n'.format(_nbytes([p.data for p in params])))
+      handle.write('gradients: {}\n'.format(_nbytes([p.grad for p in params])))
+      handle.write('optimizer: {}\n'.format(_nbytes(states)))
+
+      copy = getattr(trainer.updater, 'model', None)
+
+      if copy is not None:
+        handle.write('copy/parameters: {}\n'.format(_nbytes([p.data for p in copy.params()])))
+        handle.write('copy/gradients: {}\n'.format(_nbytes([p.grad for p in copy.params()])))
+
+      for name, size in sorted(memory.items()):
+        handle.write('{}: {}\n'.format(name, size))
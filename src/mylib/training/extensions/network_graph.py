@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import copy
+import functools
+import os
+import numpy
+import chainer
+from chainer import computational_graph
+from chainer import cuda
+from mylib.datasets import concat_examples
+from mylib.training.extensions.link_path import LinkPathTracker
+
+_VARIABLE_STYLE = {'shape': 'octagon', 'fillcolor': '#E0E0E0', 'style': 'filled'}
+_FUNCTION_STYLE = {'shape': 'record', 'fillcolor': '#6495ED', 'style': 'filled'}
+
+# functions whose FLOPs are 2 * (size of the output) * (size of a filter), where the filter is the 2nd input
+_WEIGHTED_FUNCTIONS = ('Convolution2DFunction', 'GroupedConvolution2DFunction', 'LinearFunction')
+
+
+def _size(shape):
+  return functools.reduce(lambda x, y: x * y, shape, 1)
+
+
+class _PathHook(chainer.function.FunctionHook):
+  name = 'NetworkGraph'
+
+  def __init__(self, tracker):
+    self.tracker = tracker
+
+  def forward_preprocess(self, function, in_data):
+    function._graph_path = self.tracker.path
+
+
+class NetworkGraph(chainer.training.extension.Extension):
+  '''This extension dumps the computational graph of the loss at the first iteration.
+  The graph is built once by a forward computation of a tiny batch (the first `batchsize` examples
+  of `dataset`), not by keeping the graph of the training batch, and the persistent values of links
+  (e.g. statistics of batch normalization) and the state of the random generator are restored after it.
+  Both views of the graph (`variable_name` with variables and `function_name` without them) are
+  written from one traversal, and `summary_name` lists the link path, the input and output shapes,
+  FLOPs and output bytes of each function in the order of the forward computation.
+  '''
+  def __init__(self, dataset, batchsize=2, variable_name='variable.dot', function_name='function.dot',
+               summary_name='graph.txt'):
+    self._dataset = dataset
+    self._batchsize = batchsize
+    self._variable_name = variable_name
+    self._function_name = function_name
+    self._summary_name = summary_name
+    self.trigger = lambda trainer: trainer.updater.iteration == 1
+
+  def __call__(self, trainer):
+    target = trainer.updater.get_optimizer('main').target
+    model = getattr(target, 'predictor', target)
+
+    loss = self._forward(target, model)
+    nodes, edges, functions = self._traverse(loss)
+
+    for name, remove_variable in [(self._variable_name, False), (self._function_name, True)]:
+      graph = computational_graph.ComputationalGraph(nodes, edges, variable_style=_VARIABLE_STYLE,
+                                                     function_style=_FUNCTION_STYLE,
+                                                     remove_variable=remove_variable)
+
+      with open(os.path.join(trainer.out, name), 'w') as handle:
+        handle.write(graph.dump())
+
+    self._write_summary(os.path.join(trainer.out, self._summary_name), functions)
+
+  def _forward(self, target, model):
+    batch = [self._dataset[i] for i in range(min(self._batchsize, len(self._dataset)))]
+    arrays = [target.xp.asarray(a) for a in concat_examples(batch)]
+
+    persistents = [(link, name, copy.deepcopy(getattr(link, name)))
+                   for link in target.links() for name in link._persistent]
+    random_state = numpy.random.get_state()
+
+    # values are reported to a reporter of its own so that the observation of the trainer is not changed
+    reporter = chainer.Reporter()
+    reporter.add_observer('main', target)
+    reporter.add_observers('main', target.namedlinks(skipself=True))
+
+    try:
+      with LinkPathTracker(model) as tracker, _PathHook(tracker), reporter.scope({}):
+        with chainer.using_config('train', True), chainer.using_config('enable_backprop', True):
+          return target(*arrays)
+    finally:
+      for link, name, value in persistents:
+        if isinstance(value, (numpy.ndarray, cuda.ndarray)):
+          getattr(link, name)[...] = value
+        else:
+          setattr(link, name, value)
+
+      numpy.random.set_state(random_state)
+
+  def _traverse(self, loss):
+    nodes = {id(loss.node): loss.node}
+    edges = []
+    functions = []
+    stack = [loss.creator]
+    visited = set()
+
+    while len(stack) != 0:
+      function = stack.pop()
+
+      if function is None or id(function) in visited:
+        continue
+
+      visited.add(id(function))
+      nodes[id(function)] = function
+      functions.append(function)
+
+      for output in function.outputs:
+        output = output()
+
+        if output is not None:
+          nodes[id(output)] = output
+          edges.append((function, output))
+
+      for node in function.inputs:
+        nodes[id(node)] = node
+        edges.append((node, function))
+        stack.append(node.creator)
+
+    functions.sort(key=lambda f: f.rank)
+
+    return list(nodes.values()), edges, functions
+
+  def _write_summary(self, path, functions):
+    lines = []
+    total_flops = 0
+    total_bytes = 0
+
+    for function in functions:
+      inputs = [n.shape for n in function.inputs]
+      outputs = [o() for o in function.outputs]
+      outputs = [(o.shape, o.dtype) for o in outputs if o is not None]
+
+      if type(function).__name__ in _WEIGHTED_FUNCTIONS and len(inputs) > 1:
+        flops = 2 * sum(_size(s) for s, _ in outputs) * _size(inputs[1][1:])
+      else:
+        flops = sum(_size(s) for s, _ in outputs)
+
+      nbytes = sum(_size(s) * numpy.dtype(d).itemsize for s, d in outputs)
+      total_flops += flops
+      total_bytes += nbytes
+
+      lines.append('{} {} {} -> {} flops={} bytes={}\n'.format(
+        getattr(function, '_graph_path', '/'), type(function).__name__,
+        ' '.join(str(s) for s in inputs), ' '.join(str(s) for s, _ in outputs), flops, nbytes))
+
+    batchsize = min(self._batchsize, len(self._dataset))
+
+    with open(path, 'w') as handle:
+      handle.write('batchsize: {}\n'.format(batchsize))
+      handle.write('functions: {}\n'.format(len(functions)))
+      handle.write('flops/example: {}\n'.format(total_flops // batchsize))
+      handle.write('bytes/example: {}\n'.format(total_bytes // batchsize))
+      handle.writelines(lines)
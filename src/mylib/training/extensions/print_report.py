@@ -3,11 +3,23 @@
 
 import sys
 import os
-from chainer.training import extensions
-from chainer.training.extensions import log_report as log_report_module
-from chainer.training.extensions import util
+import chainer
+
+class PrintReport(chainer.training.extension.Extension):
+  '''This extension prints the entries of the log of a LogReport (the same as
+  `chainer.training.extensions.PrintReport`, which is not imported so that matplotlib is not loaded).
+  If `out` is a string, the entries are written to the file of the name in the output directory.
+  '''
+  def __init__(self, entries, log_report='LogReport', out=sys.stdout):
+    self._entries = entries
+    self._log_report = log_report
+    self._out = out
+    self._log_len = 0
+
+    widths = [max(10, len(s)) for s in entries]
+    self._header = '  '.join('{:%d}' % w for w in widths).format(*entries) + '\n'
+    self._templates = [(e, '{:<%dg}  ' % w, ' ' * (w + 2)) for e, w in zip(entries, widths)]
 
-class PrintReport(extensions.PrintReport):
   def __call__(self, trainer):
     if isinstance(self._out, str):
       self._out = open(os.path.join(trainer.out, self._out), 'w')
@@ -23,19 +35,14 @@ class PrintReport(extensions.PrintReport):
 
     if isinstance(log_report, str):
       log_report = trainer.get_extension(log_report)
-    elif not isinstance(log_report, log_report_module.LogReport):
-      raise TypeError('log report has a wrong type %s' % type(log_report))
 
     log = log_report.log
     log_len = self._log_len
 
     while len(log) > log_len:
-      if out == sys.stdout:
-        # delete the printed contents from the current cursor
-        if os.name == 'nt':
-          util.erase_console(0, 0)
-        else:
-          out.write('\033[J')
+      # delete the printed contents from the current cursor
+      if out == sys.stdout and os.name != 'nt':
+        out.write('\033[J')
 
       self._print(log[log_len])
       out.flush()
@@ -43,3 +50,16 @@ class PrintReport(extensions.PrintReport):
       log_len += 1
 
     self._log_len = log_len
+
+  def serialize(self, serializer):
+    if not isinstance(self._log_report, str):
+      self._log_report.serialize(serializer['_log_report'])
+
+  def _print(self, observation):
+    for entry, template, empty in self._templates:
+      if entry in observation:
+        self._out.write(template.format(observation[entry]))
+      else:
+        self._out.write(empty)
+
+    self._out.write('\n')
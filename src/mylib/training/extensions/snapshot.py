@@ -0,0 +1,45 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import tempfile
+import chainer
+
+from chainer.serializers import npz
+
+class Snapshot(chainer.training.extension.Extension):
+  '''This extension saves the trainer as `chainer.training.extensions.snapshot`.
+  If `writer` is given, the trainer is saved by `writer.write(path, trainer)`
+  (e.g. `AsyncWriter`) and the writer is flushed when the training finishes.
+  '''
+  trigger = 1, 'epoch'
+  priority = -100
+
+  def __init__(self, savefun=npz.save_npz, filename='snapshot_iter_{.updater.iteration}', writer=None):
+    self._savefun = savefun
+    self._filename = filename
+    self._writer = writer
+
+  def __call__(self, trainer):
+    filename = self._filename.format(trainer)
+
+    if self._writer is not None:
+      self._writer.write(os.path.join(trainer.out, filename), trainer)
+      return
+
+    fd, tmppath = tempfile.mkstemp(prefix='tmp' + filename, dir=trainer.out)
+
+    try:
+      self._savefun(tmppath, trainer)
+    except Exception:
+      os.close(fd)
+      os.remove(tmppath)
+      raise
+
+    os.close(fd)
+    shutil.move(tmppath, os.path.join(trainer.out, filename))
+
+  def finalize(self):
+    if self._writer is not None:
+      self._writer.wait()
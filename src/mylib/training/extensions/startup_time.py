@@ -0,0 +1,35 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import time
+import chainer
+
+class StartupTime(chainer.training.extension.Extension):
+  '''This extension writes the time from the start of the process to the end of the first iteration
+  of the process (also after resuming). The time is split into the phases ended by `mark`.
+  '''
+  trigger = 1, 'iteration'
+  priority = chainer.training.extension.PRIORITY_READER
+
+  def __init__(self, start, filename='startup.txt'):
+    self._marks = [('start', start)]
+    self._filename = filename
+    self._written = False
+
+  def mark(self, name):
+    '''records the end of the phase `name`'''
+    self._marks.append((name, time.time()))
+
+  def __call__(self, trainer):
+    if self._written:
+      return
+
+    self.mark('first iteration')
+    self._written = True
+
+    with open(os.path.join(trainer.out, self._filename), 'w') as handle:
+      for (_, t1), (name, t2) in zip(self._marks[:-1], self._marks[1:]):
+        handle.write('{}: {:.3f}\n'.format(name, t2 - t1))
+
+      handle.write('total: {:.3f}\n'.format(self._marks[-1][1] - self._marks[0][1]))
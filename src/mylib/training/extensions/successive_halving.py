@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import json
+import math
+import fcntl
+import chainer
+
+class HalvingCoordinator(object):
+  '''This class shares the values of runs at rungs through a JSON file.
+  The file is locked while it is read and written, so that runs in other processes
+  can report their values at the same time. Values are grouped by `group`
+  (e.g. the name of the dataset), and only runs of the same group are compared.
+  '''
+  def __init__(self, path, group, reduction=3, comp='max'):
+    self.path = path
+    self.group = group
+    self.reduction = reduction
+    self.comp = comp
+
+  def report(self, rung, name, value):
+    '''records the value of the run at the rung and returns True if the run should be stopped.
+    A run continues if its value is in the top 1/`reduction` of the values recorded at the rung.
+    The decision is recorded, and the same decision is returned for the same run and rung.
+    '''
+    with open(self.path + '.lock', 'w') as lock:
+      fcntl.flock(lock, fcntl.LOCK_EX)
+
+      try:
+        if os.path.isfile(self.path):
+          with open(self.path, 'r') as handle:
+            data = json.load(handle)
+        else:
+          data = {}
+
+        records = data.setdefault(self.group, {}).setdefault(str(rung), {})
+
+        if name not in records:
+          values = sorted([v['value'] for v in records.values()] + [value], reverse=(self.comp == 'max'))
+          rank = values.index(value)
+          records[name] = {'value': value, 'stop': rank >= math.ceil(len(values) / self.reduction)}
+
+          with open(self.path + '.tmp', 'w') as handle:
+            json.dump(data, handle, indent=2)
+
+          os.replace(self.path + '.tmp', self.path)
+
+        return records[name]['stop']
+      finally:
+        fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+class _StopTrigger(object):
+  def __init__(self, trigger, extension):
+    self._trigger = trigger
+    self._extension = extension
+
+  def __call__(self, trainer):
+    return self._extension.stopped or self._trigger(trainer)
+
+  def __getattr__(self, name):
+    return getattr(self._trigger, name)
+
+
+class SuccessiveHalving(chainer.training.extension.Extension):
+  '''This extension stops the training at a rung if it is losing (asynchronous successive halving).
+  At the end of each epoch in `rungs`, the mean of `key` in the epoch is reported to the coordinator,
+  which compares it with the values of the other runs in the same result root (the parent directory
+  of the output of the trainer). If the run is stopped, the stop trigger of the trainer is fired after
+  the other extensions (e.g. snapshot) of the epoch are invoked, and the stopped state is serialized.
+  If `key` is not observed at a rung (e.g. the evaluation is not invoked in the epoch), the report is
+  deferred to the first epoch in which it is observed.
+  '''
+  def __init__(self, rungs, group, reduction=3, key='validation/main/accuracy', comp='max',
+               filename='halving.json', trigger=(1, 'epoch')):
+    self._rungs = sorted(rungs)
+    self._group = group
+    self._reduction = reduction
+    self._key = key
+    self._comp = comp
+    self._filename = filename
+    self._trigger = chainer.training.trigger.get_trigger(trigger)
+    self.stopped = False
+    self._pending = None
+
+    self._init_summary()
+
+  def initialize(self, trainer):
+    if not isinstance(trainer.stop_trigger, _StopTrigger):
+      trainer.stop_trigger = _StopTrigger(trainer.stop_trigger, self)
+
+  def __call__(self, trainer):
+    if self._key in trainer.observation:
+      self._summary.add({self._key: trainer.observation[self._key]})
+
+    if self._trigger(trainer):
+      if trainer.updater.epoch in self._rungs:
+        self._pending = trainer.updater.epoch
+
+      stats = self._summary.compute_mean()
+
+      if self._pending is not None and self._key in stats and not self.stopped:
+        epoch = self._pending
+        value = float(stats[self._key])
+        root, name = os.path.split(os.path.abspath(trainer.out))
+        coordinator = HalvingCoordinator(os.path.join(root, self._filename), self._group,
+                                         self._reduction, self._comp)
+        self._pending = None
+
+        if coordinator.report(epoch, name, value):
+          self.stopped = True
+          print('stopped by successive halving at epoch {} ({}: {:.4f})'.format(epoch, self._key, value))
+
+      self._init_summary()
+
+  def serialize(self, serializer):
+    self.stopped = json.loads(serializer('stopped', json.dumps(self.stopped)))
+    self._pending = json.loads(serializer('pending', json.dumps(self._pending)))
+    self._trigger.serialize(serializer['trigger'])
+
+  def _init_summary(self):
+    self._summary = chainer.reporter.DictSummary()
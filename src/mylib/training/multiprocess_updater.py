@@ -0,0 +1,249 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import math
+import multiprocessing
+import multiprocessing.sharedctypes
+import traceback
+import numpy
+import chainer
+from mylib.datasets import concat_examples
+from mylib.training.updater import StandardUpdater
+
+class _SharedArrays(object):
+  '''This class allocates a shared memory buffer with the same layout as the given arrays.'''
+  def __init__(self, arrays):
+    sizes = [a.nbytes for a in arrays]
+    self.buffer = multiprocessing.sharedctypes.RawArray('b', max(sum(sizes), 1))
+    self.views = []
+
+    offset = 0
+
+    for array, size in zip(arrays, sizes):
+      view = numpy.frombuffer(self.buffer, dtype=array.dtype, count=array.size, offset=offset)
+      self.views.append(view.reshape(array.shape))
+      offset += size
+
+
+def _get_params(model):
+  return [p for _, p in sorted(model.namedparams(), key=lambda x: x[0])]
+
+
+def _get_persistents(model):
+  persistents = []
+
+  for _, link in sorted(model.namedlinks(), key=lambda x: x[0]):
+    for name in sorted(link._persistent):
+      value = link.__dict__[name]
+
+      if isinstance(value, numpy.ndarray) and value.dtype.kind == 'f':
+        persistents.append((link, name))
+
+  return persistents
+
+
+def _to_arrays(in_arrays):
+  '''returns the list of the input arrays and their keys (None if they are positional arguments)'''
+  if isinstance(in_arrays, dict):
+    keys = sorted(in_arrays)
+    return [in_arrays[k] for k in keys], keys
+  elif isinstance(in_arrays, tuple):
+    return list(in_arrays), None
+  else:
+    return [in_arrays], None
+
+
+def _call_loss(loss_func, arrays, keys):
+  if keys is None:
+    return loss_func(*arrays)
+  else:
+    return loss_func(**dict(zip(keys, arrays)))
+
+
+def _update_replica(model, loss_func, params, persistents, shared_params, shared_states, shared_inputs, keys,
+                    grads, states, seed, index, pipe):
+  reporter = chainer.Reporter()
+  reporter.add_observer('main', model)
+  reporter.add_observers('main', model.namedlinks(skipself=True))
+
+  while True:
+    message = pipe.recv()
+
+    if message is None:
+      break
+
+    try:
+      iteration, chunks = message
+      numpy.random.seed([seed, index, iteration])
+
+      for param, array in zip(params, shared_params.views):
+        param.data[...] = array
+
+      for (link, name), array in zip(persistents, shared_states.views):
+        link.__dict__[name][...] = array
+
+      model.cleargrads()
+      observations = []
+
+      for start, end in chunks:
+        observation = {}
+
+        with reporter.scope(observation), chainer.function.force_backprop_mode():
+          loss = _call_loss(loss_func, [v[start:end] for v in shared_inputs.views], keys)
+
+        loss.backward()
+
+        observations.append({k: float(v.data if isinstance(v, chainer.Variable) else v)
+                             for k, v in observation.items()})
+
+      for param, array in zip(params, grads.views):
+        if param.grad is None:
+          array[...] = 0
+        else:
+          array[...] = param.grad
+
+      for (link, name), array in zip(persistents, states.views):
+        array[...] = link.__dict__[name]
+
+      pipe.send((observations, None))
+    except Exception:
+      pipe.send((None, traceback.format_exc()))
+
+
+class MultiprocessUpdater(StandardUpdater):
+  '''This updater computes the chunks of a batch in worker processes on CPU.
+  Each worker has a replica of the model. Parameters are copied to the replicas through
+  shared memory before each update, and gradients of the replicas are summed up through
+  shared memory and divided by the number of chunks as `StandardUpdater` does.
+  Running statistics of BatchNormalization are averaged over the replicas.
+  A batch is converted once and passed to the replicas through shared memory, whose size is
+  that of the first batch. Uninitialized parameters are initialized in the main process
+  before the replicas are forked at the first update.
+  The random generator of numpy in each worker is seeded by `seed`, the index of the worker
+  and the iteration before each update, so that the workers use different random numbers
+  (e.g. for shake-shake) which are reproducible. If `seed` is None, it is drawn from `numpy.random`.
+  '''
+  def __init__(self, iterator, optimizer, converter=concat_examples,
+               device=None, loss_func=None, procsize=None, n_processes=None, seed=None):
+    super().__init__(iterator, optimizer, converter, device, loss_func, procsize)
+    self.n_processes = n_processes or multiprocessing.cpu_count()
+    self.seed = seed
+    self._processes = None
+
+    if device is not None and device >= 0:
+      raise ValueError('MultiprocessUpdater does not support GPU')
+
+  def update_core(self):
+    batch = self.get_iterator('main').next()
+    optimizer = self.get_optimizer('main')
+    arrays, keys = _to_arrays(self.converter(batch, self.device))
+
+    repeats = max(math.ceil(len(batch) / self.procsize), 1)
+
+    if self._processes is None:
+      self._start(arrays, keys, len(batch) // repeats)
+
+    for array, view in zip(arrays, self._shared_inputs.views):
+      if array.shape[1:] != view.shape[1:] or len(array) > len(view):
+        raise ValueError('the shape of the inputs exceeds that of the first batch: {} > {}'.format(
+          array.shape, view.shape))
+
+      view[:len(array)] = array
+
+    chunks = [[] for _ in self._processes]
+
+    for param, array in zip(self._params, self._shared_params.views):
+      array[...] = param.data
+
+    for (link, name), array in zip(self._persistents, self._shared_states.views):
+      array[...] = link.__dict__[name]
+
+    for i in range(repeats):
+      start = len(batch) * i // repeats
+      end = len(batch) * (i + 1) // repeats
+      chunks[i % len(chunks)].append((start, end))
+
+    workers = [i for i, c in enumerate(chunks) if len(c) != 0]
+
+    for i in workers:
+      self._pipes[i].send((self.iteration, chunks[i]))
+
+    for i in workers:
+      observations, error = self._pipes[i].recv()
+
+      if error is not None:
+        raise RuntimeError('failed to update a replica:\n{}'.format(error))
+
+      for observation in observations:
+        chainer.reporter.report(observation)
+
+    for j, param in enumerate(self._params):
+      grad = self._grads[workers[0]].views[j].copy()
+
+      for i in workers[1:]:
+        grad += self._grads[i].views[j]
+
+      if repeats != 1:
+        grad /= repeats
+
+      param.grad = grad
+
+    for j, (link, name) in enumerate(self._persistents):
+      value = self._states[workers[0]].views[j].copy()
+
+      for i in workers[1:]:
+        value += self._states[i].views[j]
+
+      link.__dict__[name][...] = value / len(workers)
+
+    optimizer.update()
+
+  def finalize(self):
+    super().finalize()
+
+    if self._processes is None:
+      return
+
+    for pipe in self._pipes:
+      pipe.send(None)
+
+    for process in self._processes:
+      process.join()
+
+    self._processes = None
+
+  def _start(self, arrays, keys, size):
+    model = self.get_optimizer('main').target
+    loss_func = self.loss_func or model
+
+    # initialize lazy parameters before forking
+    if any(param.data is None for param in model.params()):
+      with chainer.using_config('train', False), chainer.no_backprop_mode():
+        _call_loss(loss_func, [a[:size] for a in arrays], keys)
+
+    seed = numpy.random.randint(2 ** 31) if self.seed is None else self.seed
+
+    self._params = _get_params(model)
+    self._persistents = _get_persistents(model)
+
+    params = [p.data for p in self._params]
+    states = [link.__dict__[name] for link, name in self._persistents]
+
+    self._shared_params = _SharedArrays(params)
+    self._shared_states = _SharedArrays(states)
+    self._shared_inputs = _SharedArrays(arrays)
+    self._grads = [_SharedArrays(params) for _ in range(self.n_processes)]
+    self._states = [_SharedArrays(states) for _ in range(self.n_processes)]
+    self._pipes = []
+    self._processes = []
+
+    for i in range(self.n_processes):
+      pipe, worker_pipe = multiprocessing.Pipe()
+      args = (model, loss_func, self._params, self._persistents, self._shared_params, self._shared_states,
+              self._shared_inputs, keys, self._grads[i], self._states[i], seed, i, worker_pipe)
+      process = multiprocessing.Process(target=_update_replica, args=args)
+      process.daemon = True
+      process.start()
+
+      self._pipes.append(pipe)
+      self._processes.append(process)
@@ -1,17 +1,57 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+import copy
 import math
+import numpy
 import chainer
-from chainer.dataset import convert
+from mylib.datasets import concat_examples
+
+def _call_loss(loss_func, in_arrays):
+  if isinstance(in_arrays, tuple):
+    return loss_func(*in_arrays)
+  elif isinstance(in_arrays, dict):
+    return loss_func(**in_arrays)
+  else:
+    return loss_func(in_arrays)
+
+
+def _cast_arrays(in_arrays, dtype):
+  def cast(x):
+    return x.astype(dtype) if x.dtype.kind == 'f' else x
+
+  if isinstance(in_arrays, tuple):
+    return tuple(cast(x) for x in in_arrays)
+  elif isinstance(in_arrays, dict):
+    return {k: cast(x) for k, x in in_arrays.items()}
+  else:
+    return cast(in_arrays)
+
 
 class StandardUpdater(chainer.training.StandardUpdater):
-  def __init__(self, iterator, optimizer, converter=convert.concat_examples,
-               device=None, loss_func=None, procsize=None):
+  '''Updater which splits a batch into chunks of `procsize` examples.
+  If `dtype` is not float32, the forward and backward computation runs on a copy of the target
+  whose parameters are stored in `dtype` (except those of `BatchNormalization`), while the target
+  keeps the master parameters in float32. The loss is scaled dynamically to avoid underflows
+  of the gradients: the scale is halved and the update is skipped when the gradients overflow,
+  and the scale is doubled after `scale_interval` updates without overflows.
+  '''
+  def __init__(self, iterator, optimizer, converter=concat_examples,
+               device=None, loss_func=None, procsize=None,
+               dtype=numpy.float32, loss_scale=2.0 ** 15, scale_interval=1000):
     super().__init__(iterator, optimizer, converter, device, loss_func)
     self.procsize = procsize
+    self.dtype = numpy.dtype(dtype)
+    self.loss_scale = loss_scale
+    self.scale_interval = scale_interval
+    self.scaled_iterations = 0
+    self.model = None
   
   def update_core(self):
+    if self.dtype != numpy.float32:
+      self._update_mixed()
+      return
+
     batch = self.get_iterator('main').next()
     optimizer = self.get_optimizer('main')
     loss_func = self.loss_func or optimizer.target 
@@ -26,12 +66,7 @@ class StandardUpdater(chainer.training.StandardUpdater):
       in_arrays = self.converter(batch[start:end], self.device)
     
       with chainer.function.force_backprop_mode():
-        if isinstance(in_arrays, tuple):
-          loss = loss_func(*in_arrays)
-        elif isinstance(in_arrays, dict):
-          loss = loss_func(**in_arrays)
-        else:
-          loss = loss_func(in_arrays)
+        loss = _call_loss(loss_func, in_arrays)
           
       loss.backward()
     
@@ -44,4 +79,116 @@ class StandardUpdater(chainer.training.StandardUpdater):
           v.grad = grad
       
     optimizer.update()
-      
+
+  def _update_mixed(self):
+    batch = self.get_iterator('main').next()
+    optimizer = self.get_optimizer('main')
+
+    repeats = max(math.ceil(len(batch) / self.procsize), 1)
+
+    for i in range(repeats):
+      start = len(batch) * i // repeats
+      end = len(batch) * (i + 1) // repeats
+      in_arrays = self.converter(batch[start:end], self.device)
+
+      if self.model is None:
+        self._create_model(in_arrays)
+
+      model = self.model
+      loss_func = self.loss_func or model
+
+      if i == 0:
+        model.cleargrads()
+
+      with chainer.function.force_backprop_mode():
+        loss = _call_loss(loss_func, _cast_arrays(in_arrays, self.dtype))
+
+      xp = chainer.cuda.get_array_module(loss.data)
+      loss.grad = xp.full(loss.shape, self.loss_scale, dtype=loss.dtype)
+      loss.backward()
+
+    chainer.reporter.report({'loss_scale': self.loss_scale})
+
+    # copy the unscaled gradients to the master parameters
+    params = dict(model.namedparams())
+    finite = True
+
+    for name, param in optimizer.target.namedparams():
+      grad = params[name].grad
+
+      if grad is None:
+        param.grad = None
+        continue
+
+      xp = chainer.cuda.get_array_module(grad)
+      grad = grad.astype(param.dtype) / (self.loss_scale * repeats)
+      finite = finite and bool(xp.isfinite(grad).all())
+      param.grad = grad
+
+    self._copy_persistents(model, optimizer.target)
+
+    if not finite:
+      self.loss_scale /= 2
+      self.scaled_iterations = 0
+      return
+
+    optimizer.update()
+
+    for name, param in optimizer.target.namedparams():
+      params[name].data[...] = param.data
+
+    self.scaled_iterations += 1
+
+    if self.scaled_iterations >= self.scale_interval:
+      self.loss_scale *= 2
+      self.scaled_iterations = 0
+
+  def _create_model(self, in_arrays):
+    '''creates the working copy of the target whose parameters are stored in `dtype`'''
+    target = self.get_optimizer('main').target
+
+    # initialize lazy parameters before copying
+    if any(param.data is None for param in target.params()):
+      with chainer.using_config('train', False), chainer.no_backprop_mode():
+        _call_loss(self.loss_func or target, in_arrays)
+
+    model = copy.deepcopy(target)
+    model.cleargrads()
+
+    for link in model.links():
+      if isinstance(link, chainer.links.BatchNormalization):
+        continue
+
+      for name in link._params:
+        param = getattr(link, name)
+        param.data = param.data.astype(self.dtype)
+
+    # observations of the copy are reported with the names of the target
+    reporter = chainer.reporter.get_current_reporter()
+    reporter.add_observer('main', model)
+    reporter.add_observers('main', model.namedlinks(skipself=True))
+
+    self.model = model
+
+  def _copy_persistents(self, src, dst):
+    '''copies the persistent values (e.g. statistics of BatchNormalization) of the working copy'''
+    links = dict(dst.namedlinks())
+
+    for path, link in src.namedlinks():
+      for name in link._persistent:
+        value = getattr(link, name)
+
+        if numpy.isscalar(value):
+          setattr(links[path], name, value)
+        else:
+          getattr(links[path], name)[...] = value
+
+  def serialize(self, serializer):
+    super().serialize(serializer)
+
+    if self.dtype != numpy.float32:
+      try:
+        self.loss_scale = float(serializer('loss_scale', self.loss_scale))
+        self.scaled_iterations = int(serializer('scaled_iterations', self.scaled_iterations))
+      except KeyError:
+        pass
@@ -7,24 +7,14 @@ Residual Block : BN - Conv(3x3) - BN - ReLU - Conv(3x3) - BN
 @author: Atsushi TAKEDA
 '''
 import chainer
-
-
-def reshape(x, channels):
-  if x.shape[1] < channels:
-    xp = chainer.cuda.get_array_module(x)
-    p = xp.zeros((x.shape[0], channels - x.shape[1], x.shape[2], x.shape[3]), dtype=x.dtype)
-    x = chainer.functions.concat((x, p), axis=1)
-  elif x.shape[1] > channels:
-    x = x[:, :channels, :]
-
-  return x
+import mylib
 
 
 class DenseUnit(chainer.Chain):
   def __init__(self, in_channels, out_channels):
-    super().__init__(norm0=chainer.links.BatchNormalization(in_channels),
+    super().__init__(norm0=mylib.links.BatchNormalization(in_channels),
                      conv1=chainer.links.Convolution2D(in_channels, out_channels, 3, pad=1),
-                     norm1=chainer.links.BatchNormalization(out_channels))
+                     norm1=mylib.links.BatchNormalization(out_channels))
 
   def __call__(self, x):
     x = self.norm0(x)
@@ -36,31 +26,64 @@ class DenseUnit(chainer.Chain):
 
 
 class DenseBlock(chainer.ChainList):
-  def __init__(self, in_channels, growth, depth):
+  def __init__(self, in_channels, growth, depth, recompute=False):
     units = [DenseUnit(in_channels + growth * i, growth) for i in range(depth)]
 
     super().__init__(*units)
+    self.growth = growth
+    self.recompute = recompute
+    self.reported = False
 
   def __call__(self, x):
-    for layer in self:
-      y = layer(x)
-      x = chainer.functions.concat((x, y), axis=1)
+    # outputs of all units are written into one buffer instead of concatenating them repeatedly
+    xp = chainer.cuda.get_array_module(x)
+    shape = (x.shape[0], x.shape[1] + self.growth * len(self), x.shape[2], x.shape[3])
+    buffer = xp.empty(shape, dtype=x.dtype)
+    saved_memory = self._estimate_saved_memory(x)
+
+    for i, layer in enumerate(self):
+      if self.recompute and chainer.config.train:
+        y = mylib.functions.recompute(layer, x)
+      else:
+        y = layer(x)
+
+      x = mylib.functions.dense_concat(x, y, buffer, copy=(i == 0))
+
+    # the estimated saved memory is reported once at the first forward computation in training
+    if chainer.config.train and not self.reported:
+      chainer.reporter.report({'estimated_saved_memory': saved_memory}, self)
+      self.reported = True
 
     return x
 
+  def _estimate_saved_memory(self, x):
+    '''returns the size (bytes) of arrays which are not allocated by the shared buffer and the recomputation.
+    It is computed from the shapes of the arrays, not measured.'''
+    unit_size = x.shape[0] * x.shape[2] * x.shape[3] * x.dtype.itemsize
+    channels = [x.shape[1] + self.growth * i for i in range(len(self) + 1)]
+
+    # concatenation allocates an output for every unit, but the buffer is allocated once
+    saved_memory = (sum(channels[1:]) - channels[-1]) * unit_size
+
+    # recomputation does not keep outputs of BN, ReLU and Conv in every unit
+    if self.recompute and chainer.config.train:
+      saved_memory += sum(c * 2 + self.growth for c in channels[:-1]) * unit_size
+
+    return saved_memory
+
 
 class Network(chainer.Chain):
-  def __init__(self, category, params):
+  def __init__(self, category, params, recompute=False):
     depth, growth = params
     depth = (depth - 2) // 3
 
     super().__init__(input=chainer.links.Convolution2D(None, 16, 3, pad=1),
-                     norm=chainer.links.BatchNormalization(16),
-                     block1=DenseBlock(16 + growth * depth * 0, growth, depth),
+                     norm=mylib.links.BatchNormalization(16),
+                     block1=DenseBlock(16 + growth * depth * 0, growth, depth, recompute),
                      conv1=chainer.links.Convolution2D(16 + growth * depth * 1, 16 + growth * depth * 1, 1),
-                     block2=DenseBlock(16 + growth * depth * 1, growth, depth),
+                     block2=DenseBlock(16 + growth * depth * 1, growth, depth, recompute),
                      conv2=chainer.links.Convolution2D(16 + growth * depth * 2, 16 + growth * depth * 2, 1),
-                     block3=DenseBlock(16 + growth * depth * 2, growth, depth),
+                     block3=DenseBlock(16 + growth * depth * 2, growth, depth, recompute),
                      output=chainer.links.Linear(16 + growth * depth * 3, category))
 
   def __call__(self, x):
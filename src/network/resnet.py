@@ -7,26 +7,16 @@ Residual Block : BN - Conv(3x3) - BN - ReLU - Conv(3x3) - BN
 @author: Atsushi TAKEDA
 '''
 import chainer
-
-
-def reshape(x, channels):
-  if x.shape[1] < channels:
-    xp = chainer.cuda.get_array_module(x)
-    p = xp.zeros((x.shape[0], channels - x.shape[1], x.shape[2], x.shape[3]), dtype=x.dtype)
-    x = chainer.functions.concat((x, p), axis=1)
-  elif x.shape[1] > channels:
-    x = x[:, :channels, :]
-
-  return x
+import mylib
 
 
 class ResidualUnit(chainer.Chain):
   def __init__(self, in_channels, out_channels):
-    super().__init__(norm0=chainer.links.BatchNormalization(in_channels),
+    super().__init__(norm0=mylib.links.BatchNormalization(in_channels),
                      conv1=chainer.links.Convolution2D(in_channels, out_channels, 3, pad=1),
-                     norm1=chainer.links.BatchNormalization(out_channels),
+                     norm1=mylib.links.BatchNormalization(out_channels),
                      conv2=chainer.links.Convolution2D(out_channels, out_channels, 3, pad=1),
-                     norm2=chainer.links.BatchNormalization(out_channels))
+                     norm2=mylib.links.BatchNormalization(out_channels))
 
   def __call__(self, x):
     x = self.norm0(x)
@@ -40,32 +30,38 @@ class ResidualUnit(chainer.Chain):
 
 
 class ResidualBlock(chainer.ChainList):
-  def __init__(self, in_channels, out_channels, depth):
+  def __init__(self, in_channels, out_channels, depth, recompute=False):
     units = [ResidualUnit(in_channels, out_channels)]
     units += [ResidualUnit(out_channels, out_channels) for _ in range(depth - 1)]
 
     super().__init__(*units)
+    self.recompute = recompute
 
   def __call__(self, x):
+    if self.recompute and chainer.config.train:
+      return mylib.functions.recompute(self._forward, x)
+    else:
+      return self._forward(x)
+
+  def _forward(self, x):
     for layer in self:
       y = layer(x)
-      y += reshape(x, y.shape[1])
-      x = y
+      x = mylib.functions.shortcut_add(y, x)
 
     return x
 
 
 class Network(chainer.Chain):
-  def __init__(self, category, params):
+  def __init__(self, category, params, recompute=False):
     depth, width = params
     depth = (depth - 2) // 6
     width = width * 16
 
     super().__init__(input=chainer.links.Convolution2D(None, width, 3, pad=1),
-                     norm=chainer.links.BatchNormalization(width),
-                     block1=ResidualBlock(width * 1, width * 1, depth),
-                     block2=ResidualBlock(width * 1, width * 2, depth),
-                     block3=ResidualBlock(width * 2, width * 4, depth),
+                     norm=mylib.links.BatchNormalization(width),
+                     block1=ResidualBlock(width * 1, width * 1, depth, recompute),
+                     block2=ResidualBlock(width * 1, width * 2, depth, recompute),
+                     block3=ResidualBlock(width * 2, width * 4, depth, recompute),
                      output=chainer.links.Linear(width * 4, category))
 
   def __call__(self, x):
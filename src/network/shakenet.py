@@ -6,27 +6,17 @@ Shake-Shake Residual Network (pre-activation)モジュール。
 Residual Block : BN - Conv(3x3) - BN - ReLU - Conv(3x3) - BN
 @author: Atsushi TAKEDA
 '''
+import numpy
 import chainer
 import mylib
 
-def reshape(x, channels):
-  if x.shape[1] < channels:
-    xp = chainer.cuda.get_array_module(x)
-    p = xp.zeros((x.shape[0], channels - x.shape[1], x.shape[2], x.shape[3]), dtype=x.dtype)
-    x = chainer.functions.concat((x, p), axis=1)
-  elif x.shape[1] > channels:
-    x = x[:, :channels, :]
-
-  return x
-
-
 class ShakeLine(chainer.Chain):
   def __init__(self, in_channels, out_channels):
-    super().__init__(norm0=chainer.links.BatchNormalization(in_channels),
+    super().__init__(norm0=mylib.links.BatchNormalization(in_channels),
                      conv1=chainer.links.Convolution2D(in_channels, out_channels, 3, pad=1),
-                     norm1=chainer.links.BatchNormalization(out_channels),
+                     norm1=mylib.links.BatchNormalization(out_channels),
                      conv2=chainer.links.Convolution2D(out_channels, out_channels, 3, pad=1),
-                     norm2=chainer.links.BatchNormalization(out_channels))
+                     norm2=mylib.links.BatchNormalization(out_channels))
 
   def __call__(self, x):
     x = self.norm0(x)
@@ -40,45 +30,94 @@ class ShakeLine(chainer.Chain):
 
 
 class ShakeUnit(chainer.Chain):
-  def __init__(self, in_channels, out_channels):
+  def __init__(self, in_channels, out_channels, shake='binary'):
     super().__init__(line1=ShakeLine(in_channels, out_channels),
                      line2=ShakeLine(in_channels, out_channels))
+    self.shake = shake
 
   def __call__(self, x):
     y1 = self.line1(x)
     y2 = self.line2(x)
-    y = mylib.functions.shake_noise(y1, y2)
+    y = mylib.functions.shake_noise(y1, y2, self.shake)
 
     return y
 
 
+def _line_weights(in_channels, out_channels):
+  '''returns the weights of the convolutions of the two lines stacked as two groups,
+  which are initialized by the default initializer of Convolution2D as those of ShakeLine'''
+  initializer = chainer.initializers.HeNormal(1 / numpy.sqrt(2))
+  W = numpy.empty((2, out_channels, in_channels, 3, 3), dtype=numpy.float32)
+
+  for w in W:
+    initializer(w)
+
+  return W
+
+
+class FusedShakeUnit(chainer.Chain):
+  '''ShakeUnit which computes the two lines at once.
+  The input is duplicated for the two lines and all the links of the lines are computed as one link
+  with the channels of the two lines (the convolutions are grouped convolutions with two groups),
+  so that each line has its own parameters of the batch normalizations as in ShakeUnit.
+  The outputs of the lines are mixed by `split_shake_noise` without splitting them.
+  '''
+  def __init__(self, in_channels, out_channels, shake='binary'):
+    super().__init__(norm0=mylib.links.BatchNormalization(in_channels * 2),
+                     conv1=mylib.links.GroupedConvolution2D(in_channels * 2, out_channels * 2, 2, 3, pad=1,
+                                                            initialW=_line_weights(in_channels, out_channels)),
+                     norm1=mylib.links.BatchNormalization(out_channels * 2),
+                     conv2=mylib.links.GroupedConvolution2D(out_channels * 2, out_channels * 2, 2, 3, pad=1,
+                                                            initialW=_line_weights(out_channels, out_channels)),
+                     norm2=mylib.links.BatchNormalization(out_channels * 2))
+    self.shake = shake
+
+  def __call__(self, x):
+    x = chainer.functions.concat((x, x), axis=1)
+    x = self.norm0(x)
+    x = self.conv1(x)
+    x = self.norm1(x)
+    x = chainer.functions.relu(x)
+    x = self.conv2(x)
+    x = self.norm2(x)
+
+    return mylib.functions.split_shake_noise(x, self.shake)
+
+
 class ShakeBlock(chainer.ChainList):
-  def __init__(self, in_channels, out_channels, depth):
-    units = [ShakeUnit(in_channels, out_channels)]
-    units += [ShakeUnit(out_channels, out_channels) for _ in range(depth - 1)]
+  def __init__(self, in_channels, out_channels, depth, recompute=False, fused=False, shake='binary'):
+    unit = FusedShakeUnit if fused else ShakeUnit
+    units = [unit(in_channels, out_channels, shake)]
+    units += [unit(out_channels, out_channels, shake) for _ in range(depth - 1)]
 
     super().__init__(*units)
+    self.recompute = recompute
 
   def __call__(self, x):
+    if self.recompute and chainer.config.train:
+      return mylib.functions.recompute(self._forward, x)
+    else:
+      return self._forward(x)
+
+  def _forward(self, x):
     for layer in self:
       y = layer(x)
-      y += reshape(x, y.shape[1])
-      x = y
+      x = mylib.functions.shortcut_add(y, x)
 
     return x
 
 
 class Network(chainer.Chain):
-  def __init__(self, category, params):
+  def __init__(self, category, params, recompute=False, fused=False, shake='binary'):
     depth, width = params
     depth = (depth - 2) // 6
     width = width * 16
 
     super().__init__(input=chainer.links.Convolution2D(None, width, 3, pad=1),
-                     norm=chainer.links.BatchNormalization(width),
-                     block1=ShakeBlock(width * 1, width * 1, depth),
-                     block2=ShakeBlock(width * 1, width * 2, depth),
-                     block3=ShakeBlock(width * 2, width * 4, depth),
+                     norm=mylib.links.BatchNormalization(width),
+                     block1=ShakeBlock(width * 1, width * 1, depth, recompute, fused, shake),
+                     block2=ShakeBlock(width * 1, width * 2, depth, recompute, fused, shake),
+                     block3=ShakeBlock(width * 2, width * 4, depth, recompute, fused, shake),
                      output=chainer.links.Linear(width * 4, category))
 
   def __call__(self, x):
@@ -0,0 +1,173 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+学習済みのネットワークで画像を分類するモジュール。
+'''
+
+import os
+import argparse
+import queue
+import sys
+import threading
+import time
+import numpy
+import chainer
+from export import load_inference_model, load_network
+from train import SNAPSHOT_PREFIX, create_network, get_result_dir, load_network_args
+
+DATASET_CATEGORIES = {'mnist': 10, 'cifar10': 10, 'cifar100': 100}
+DATASET_SHAPES = {'mnist': (1, 28, 28), 'cifar10': (3, 32, 32), 'cifar100': (3, 32, 32)}
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp')
+
+
+def read_images(path, shape):
+  '''generates pairs of a name and an image (normalized to [0, 1]) from the path.
+  The path is a directory of images, a `.npy` file, or a raw float32 file read as a memory map.
+  '''
+  if os.path.isdir(path):
+    from PIL import Image
+
+    for name in sorted(os.listdir(path)):
+      if os.path.splitext(name)[1].lower() not in IMAGE_EXTENSIONS:
+        continue
+
+      with Image.open(os.path.join(path, name)) as image:
+        image = image.convert('L' if shape[0] == 1 else 'RGB').resize(shape[:0:-1])
+        image = numpy.asarray(image, dtype=numpy.float32) / 255
+
+      yield name, image.reshape(shape[1], shape[2], shape[0]).transpose(2, 0, 1)
+  else:
+    if path.endswith('.npy'):
+      images = numpy.load(path, mmap_mode='r')
+    else:
+      images = numpy.memmap(path, dtype=numpy.float32, mode='r')
+
+    images = images.reshape((-1,) + shape)
+
+    for i, image in enumerate(images):
+      yield str(i), image
+
+
+class DynamicBatcher(object):
+  '''This class collects images which arrive one by one into batches.
+  A batch is made when `batchsize` images are collected or when `timeout` seconds
+  have passed since the first image of the batch arrived.
+  '''
+  def __init__(self, images, batchsize, timeout):
+    self._queue = queue.Queue(maxsize=batchsize * 4)
+    self._batchsize = batchsize
+    self._timeout = timeout
+    self._thread = threading.Thread(target=self._read, args=(images,))
+    self._thread.daemon = True
+    self._thread.start()
+
+  def _read(self, images):
+    for item in images:
+      self._queue.put(item)
+
+    self._queue.put(None)
+
+  def __iter__(self):
+    finished = False
+
+    while not finished:
+      item = self._queue.get()
+
+      if item is None:
+        break
+
+      batch = [item]
+      deadline = time.perf_counter() + self._timeout
+
+      while len(batch) < self._batchsize:
+        try:
+          item = self._queue.get(timeout=max(deadline - time.perf_counter(), 0))
+        except queue.Empty:
+          break
+
+        if item is None:
+          finished = True
+          break
+
+        batch.append(item)
+
+      yield batch
+
+
+def main():
+  parser = argparse.ArgumentParser(description='image classifier')
+  parser.add_argument('dataset', metavar='DATASET', help='datasets name which the network was trained by')
+  parser.add_argument('network', metavar='NETWORK', help='network name')
+  parser.add_argument('params', type=int, nargs='*', metavar='PARAMS', help='parameters')
+  parser.add_argument('--input', '-i', required=True,
+                      metavar='PATH', help='directory of images, .npy file or raw float32 file')
+  parser.add_argument('--learning', '-l', default='step', choices=('step', 'cosine', 'restart'),
+                      metavar='NAME', help='name of learning rate control')
+  parser.add_argument('--model', default=None,
+                      metavar='FILE', help='snapshot of trainer (default: bestshot.npz of the result)')
+  parser.add_argument('--inference', action='store_true', default=False,
+                      help='load the model exported by export.py (default: inference.npz of the result)')
+  parser.add_argument('--batchsize', '-b', type=int, default=100,
+                      metavar='BATCH_SIZE', help='maximum number of images in a batch')
+  parser.add_argument('--timeout', type=float, default=10,
+                      metavar='MILLISECONDS', help='maximum waiting time for filling a batch')
+  parser.add_argument('--top', '-k', type=int, default=1,
+                      metavar='K', help='number of predictions for each image')
+  parser.add_argument('--gpu', '-g', type=int, default=-1,
+                      metavar='GPU_ID', help='GPU ID')
+  args = parser.parse_args()
+
+  category = DATASET_CATEGORIES[args.dataset]
+  shape = DATASET_SHAPES[args.dataset]
+  result_dir = get_result_dir(args.dataset, args.network, args.params, args.learning)
+  x = numpy.zeros((1,) + shape, dtype=numpy.float32)
+
+  if args.inference:
+    model_path = args.model or os.path.join(result_dir, 'inference.npz')
+    network = create_network(args.network, category, args.params, **load_network_args(model_path))
+    load_inference_model(network, model_path, x)
+  else:
+    model_path = args.model or os.path.join(result_dir, 'bestshot.npz')
+    network = create_network(args.network, category, args.params, **load_network_args(model_path, SNAPSHOT_PREFIX))
+    load_network(network, model_path, x)
+
+  xp = numpy
+
+  if args.gpu >= 0:
+    chainer.cuda.get_device(args.gpu).use()
+    network.to_gpu()
+    xp = chainer.cuda.cupy
+
+  images = read_images(args.input, shape)
+  latencies = []
+  count = 0
+  start = time.perf_counter()
+
+  with chainer.using_config('train', False), chainer.no_backprop_mode():
+    for batch in DynamicBatcher(images, args.batchsize, args.timeout / 1000):
+      batch_start = time.perf_counter()
+
+      x = xp.asarray(numpy.stack([image for _, image in batch]))
+      y = chainer.cuda.to_cpu(chainer.functions.softmax(network(x)).data)
+      latencies.append(time.perf_counter() - batch_start)
+      count += len(batch)
+
+      top = numpy.argsort(-y, axis=1)[:, :args.top]
+
+      for (name, _), indices, probs in zip(batch, top, y):
+        predictions = ' '.join('{}:{:.4f}'.format(i, probs[i]) for i in indices)
+        print('{}\t{}'.format(name, predictions))
+
+  elapsed = time.perf_counter() - start
+
+  if count != 0:
+    latencies = numpy.array(latencies) * 1000
+    sys.stderr.write('images: {}, batches: {}, throughput: {:.1f} images/sec\n'.format(
+      count, len(latencies), count / elapsed))
+    sys.stderr.write('latency per batch: p50 {:.2f}ms, p99 {:.2f}ms\n'.format(
+      numpy.percentile(latencies, 50), numpy.percentile(latencies, 99)))
+
+
+if __name__ == '__main__':
+  main()
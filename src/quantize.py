@@ -0,0 +1,266 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+学習済みのネットワークの重みをint8に量子化するモジュール。
+Convolution、Grouped Convolution、Linearの入力と重みをint8で表現し、整数演算と同じ結果をfloat32の行列積で計算して推論します。
+入力のスケールはテストデータの一部を用いてチャンネル毎に決定され、重みに畳み込まれます。
+'''
+
+import os
+import io
+import argparse
+import copy
+import numpy
+import chainer
+import mylib
+from chainer.utils import conv
+from export import fold_batch_normalization, load_network, measure
+from train import SNAPSHOT_PREFIX, create_network, get_result_dir, load_dataset, load_network_args
+
+QUANTIZABLE_LINKS = (chainer.links.Convolution2D, chainer.links.Linear, mylib.links.GroupedConvolution2D)
+
+# the number of products of int8 values whose sum is exactly represented in float32 (2^24 / 127^2)
+EXACT_TERMS = 2 ** 24 // (127 * 127)
+
+
+def _pair(x):
+  if hasattr(x, '__getitem__'):
+    return x
+  return x, x
+
+
+class QuantizedLink(chainer.Link):
+  '''link which computes a convolution or a linear layer with int8 inputs and weights.
+  A linear layer is computed as a 1x1 convolution of a 1x1 image, and a convolution as
+  a grouped convolution of one group. The int8 values are multiplied by the matrix product of float32
+  (BLAS), which is exact for sums of up to `EXACT_TERMS` products, and the products of longer sums
+  are split into the parts of `EXACT_TERMS` and accumulated in int32, so that the results are
+  the same as those of integer arithmetic.
+  If `calibrate` is True, the link runs the original link until `quantize` is called
+  and records the maximum absolute values of the inputs for every channel.
+  '''
+  def __init__(self, link, calibrate=True):
+    super().__init__()
+
+    if isinstance(link, chainer.links.Linear):
+      self.linear = True
+      self.units = 1
+      self.stride = (1, 1)
+      self.pad = (0, 0)
+      shape = (1,) + link.W.shape + (1, 1)
+    elif isinstance(link, mylib.links.GroupedConvolution2D):
+      self.linear = False
+      self.units = link.units
+      self.stride = _pair(link.stride)
+      self.pad = _pair(link.pad)
+      shape = link.W.shape
+    else:
+      self.linear = False
+      self.units = 1
+      self.stride = _pair(link.stride)
+      self.pad = _pair(link.pad)
+      shape = (1,) + link.W.shape
+
+    self.shape = shape
+    self.link = link if calibrate else None
+    self.amax = numpy.zeros(shape[0] * shape[2], dtype=numpy.float32)
+
+    self.add_persistent('W', numpy.zeros(shape, dtype=numpy.int8))
+    self.add_persistent('x_scale', numpy.zeros(shape[0] * shape[2], dtype=numpy.float32))
+    self.add_persistent('y_scale', numpy.zeros(shape[:2], dtype=numpy.float32))
+    self.add_persistent('b', numpy.zeros(shape[:2], dtype=numpy.float32))
+
+  def __call__(self, x):
+    if isinstance(x, chainer.Variable):
+      x = x.data
+
+    if self.linear:
+      x = x.reshape(len(x), -1, 1, 1)
+
+    if self.link is not None:
+      self.amax = numpy.maximum(self.amax, numpy.abs(x).max(axis=(0, 2, 3)))
+      y = self.link(x.reshape(len(x), -1) if self.linear else x)
+    else:
+      y = chainer.Variable(self._forward(x))
+
+    return y
+
+  def _forward(self, x):
+    units, out_channels, in_channels, kh, kw = self.shape
+
+    x = numpy.rint(x / self.x_scale[None, :, None, None])
+    x = numpy.clip(x, -127, 127).astype(numpy.int8)
+
+    col = conv.im2col_cpu(x, kh, kw, self.stride[0], self.stride[1], self.pad[0], self.pad[1])
+    n, _, _, _, oh, ow = col.shape
+    col = col.reshape(n, units, in_channels * kh * kw, oh * ow).transpose(1, 2, 0, 3)
+    col = col.reshape(units, in_channels * kh * kw, n * oh * ow).astype(numpy.float32)
+
+    W = self.W.reshape(units, out_channels, -1).astype(numpy.float32)
+    size = W.shape[2]
+
+    if size <= EXACT_TERMS:
+      y = numpy.matmul(W, col)
+    else:
+      y = numpy.zeros((units, out_channels, col.shape[2]), dtype=numpy.int32)
+
+      for start in range(0, size, EXACT_TERMS):
+        end = min(start + EXACT_TERMS, size)
+        y += numpy.matmul(W[:, :, start:end], col[:, start:end]).astype(numpy.int32)
+
+    y = y.astype(numpy.float32) * self.y_scale[:, :, None] + self.b[:, :, None]
+    y = y.reshape(units, out_channels, n, oh, ow).transpose(2, 0, 1, 3, 4)
+    y = y.reshape(n, units * out_channels, oh, ow)
+
+    if self.linear:
+      y = y.reshape(n, -1)
+
+    return y
+
+  def quantize(self):
+    '''quantizes the weights by the recorded ranges of the inputs and stops the calibration'''
+    units, out_channels, in_channels = self.shape[:3]
+
+    x_scale = numpy.maximum(self.amax, 1e-8) / 127
+    W = self.link.W.data.reshape(self.shape) * x_scale.reshape(units, 1, in_channels, 1, 1)
+    y_scale = numpy.maximum(numpy.abs(W).reshape(units, out_channels, -1).max(axis=2), 1e-8) / 127
+
+    self.W[...] = numpy.clip(numpy.rint(W / y_scale[:, :, None, None, None]), -127, 127)
+    self.x_scale[...] = x_scale
+    self.y_scale[...] = y_scale
+
+    if self.link.b is not None:
+      self.b[...] = self.link.b.data.reshape(units, out_channels)
+
+    self.link = None
+
+
+def replace_links(network, calibrate=True):
+  '''replaces every quantizable link with a quantized link and returns the list of them'''
+  links = []
+
+  for chain in list(network.links()):
+    if not isinstance(chain, chainer.Chain):
+      continue
+
+    for name in sorted(chain._children):
+      link = getattr(chain, name)
+
+      if not isinstance(link, QUANTIZABLE_LINKS):
+        continue
+
+      quantized = QuantizedLink(link, calibrate)
+
+      delattr(chain, name)
+
+      with chain.init_scope():
+        setattr(chain, name, quantized)
+
+      links.append(quantized)
+
+  return links
+
+
+def load_quantized_model(network, path, x):
+  '''initializes the network by the input, quantizes it and loads the parameters of the quantized model'''
+  with chainer.using_config('train', False), chainer.no_backprop_mode():
+    network(x)
+
+  fold_batch_normalization(network)
+  replace_links(network, calibrate=False)
+  chainer.serializers.load_npz(path, network)
+
+
+def evaluate(network, dataset, batchsize):
+  '''returns the accuracy of the network on the dataset'''
+  iterator = mylib.iterators.SerialIterator(dataset, batchsize, repeat=False, shuffle=False)
+  correct = 0
+
+  with chainer.using_config('train', False), chainer.no_backprop_mode():
+    for batch in iterator:
+      x, t = mylib.datasets.concat_examples(batch)
+      correct += int((network(x).data.argmax(axis=1) == t).sum())
+
+  return correct / len(dataset)
+
+
+def main():
+  parser = argparse.ArgumentParser(description='network quantizer for int8 inference')
+  parser.add_argument('dataset', metavar='DATASET', help='datasets name')
+  parser.add_argument('network', metavar='NETWORK', help='network name')
+  parser.add_argument('params', type=int, nargs='*', metavar='PARAMS', help='parameters')
+  parser.add_argument('--learning', '-l', default='step', choices=('step', 'cosine', 'restart'),
+                      metavar='NAME', help='name of learning rate control')
+  parser.add_argument('--model', default=None,
+                      metavar='FILE', help='snapshot of trainer (default: bestshot.npz of the result)')
+  parser.add_argument('--output', '-o', default=None,
+                      metavar='FILE', help='quantized model (default: quantized.npz of the result)')
+  parser.add_argument('--calibration', type=int, default=1000,
+                      metavar='IMAGES', help='number of test images for calibration')
+  parser.add_argument('--samples', type=int, default=None,
+                      metavar='IMAGES', help='number of test images for evaluation (default: all)')
+  parser.add_argument('--batchsize', '-b', type=int, default=100,
+                      metavar='BATCH_SIZE', help='batch size of calibration, evaluation and measurement')
+  parser.add_argument('--repeat', type=int, default=10,
+                      metavar='REPEAT', help='number of measurements of latency')
+  parser.add_argument('--seed', type=int, default=0,
+                      metavar='SEED', help='random seed of selecting images for calibration')
+  args = parser.parse_args()
+
+  result_dir = get_result_dir(args.dataset, args.network, args.params, args.learning)
+  model_path = args.model or os.path.join(result_dir, 'bestshot.npz')
+  output_path = args.output or os.path.join(result_dir, 'quantized.npz')
+
+  category, _, test_data = load_dataset(args.dataset)
+  samples = args.samples or len(test_data)
+  indices = numpy.random.RandomState(args.seed).permutation(len(test_data))[:args.calibration]
+  calibration_data = chainer.datasets.SubDataset(test_data, 0, len(indices), order=indices)
+  evaluation_data = chainer.datasets.SubDataset(test_data, 0, min(samples, len(test_data)))
+
+  batch = mylib.iterators.SerialIterator(test_data, args.batchsize, repeat=False, shuffle=False).next()
+  x, _ = mylib.datasets.concat_examples(batch)
+
+  network_args = load_network_args(model_path, SNAPSHOT_PREFIX)
+  network = create_network(args.network, category, args.params, **network_args)
+  load_network(network, model_path, x)
+  fold_batch_normalization(network)
+
+  buffer = io.BytesIO()
+  chainer.serializers.save_npz(buffer, network)
+  original_size = len(buffer.getvalue())
+  original = copy.deepcopy(network)
+
+  # calibration
+  links = replace_links(network)
+  iterator = mylib.iterators.SerialIterator(calibration_data, args.batchsize, repeat=False, shuffle=False)
+
+  with chainer.using_config('train', False), chainer.no_backprop_mode():
+    for batch in iterator:
+      network(mylib.datasets.concat_examples(batch)[0])
+
+  for link in links:
+    link.quantize()
+
+  chainer.serializers.save_npz(output_path, network)
+
+  # evaluate the saved model
+  quantized = create_network(args.network, category, args.params, **network_args)
+  load_quantized_model(quantized, output_path, x)
+
+  original_accuracy = evaluate(original, evaluation_data, args.batchsize)
+  quantized_accuracy = evaluate(quantized, evaluation_data, args.batchsize)
+  original_time = measure(original, x, args.repeat)
+  quantized_time = measure(quantized, x, args.repeat)
+
+  print('quantized links: {}'.format(len(links)))
+  print('output: {}'.format(output_path))
+  print('size: {:.2f}MB -> {:.2f}MB'.format(original_size / 1000000, os.path.getsize(output_path) / 1000000))
+  print('accuracy: {:.4f} -> {:.4f} ({:+.4f}, images: {})'.format(
+    original_accuracy, quantized_accuracy, quantized_accuracy - original_accuracy, len(evaluation_data)))
+  print('latency: {:.2f}ms -> {:.2f}ms (batch size: {})'.format(
+    original_time * 1000, quantized_time * 1000, len(x)))
+
+
+if __name__ == '__main__':
+  main()
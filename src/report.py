@@ -8,16 +8,60 @@
 import os
 import re
 import json
+import pickle
+import concurrent.futures
 import matplotlib.pyplot
 
 GRAPH_FIGURE_SIZE = (8, 5)
 GRAPH_FONT_SIZE = 12
+CACHE_FILE = '.report.pkl'
+TAIL_SIZE = 64
+
+SEPARATOR = re.compile(r'[\s\[\],]*')
+
+
+def _parse_entries(text):
+  '''parses the complete JSON objects in a text of a log.
+  Both a JSON array and JSON lines are accepted.
+  Returns the objects and the number of bytes of the parsed text.
+  '''
+  decoder = json.JSONDecoder()
+  entries = []
+  position = 0
+  end = 0
+
+  while True:
+    position = SEPARATOR.match(text, position).end()
+
+    if position >= len(text):
+      break
+
+    try:
+      entry, position = decoder.raw_decode(text, position)
+    except ValueError:
+      break
+
+    entries.append(entry)
+    end = position
+
+  return entries, len(text[:end].encode('utf-8'))
+
+
+def _call(target, name, *args):
+  return getattr(target, name)(*args)
+
+
+def _format_min(log, key):
+  values = [v[key] for v in log if key in v]
+  return '{:.4f}'.format(min(values)) if len(values) != 0 else '-'
+
 
 class Data(object):
-  def __init__(self, path):
+  def __init__(self, path, cache=None):
     self.path = path
     self._read_size()
-    self._read_log()
+    self._read_memory()
+    self._read_log({} if cache is None else cache)
 
   def _read_size(self):
     with open(os.path.join(self.path, 'size.txt'), 'r') as handle:
@@ -28,18 +72,62 @@ class Data(object):
 
     raise Exception('size data is not found')
 
-  def _read_log(self):
-    with open(os.path.join(self.path, 'log.txt'), 'r') as handle:
-      self.log = json.load(handle)
+  def _read_memory(self):
+    '''reads the memory usage written by `MemoryUsage` if it exists'''
+    self.memory = {}
+    file = os.path.join(self.path, 'memory.txt')
+
+    if os.path.isfile(file):
+      with open(file, 'r') as handle:
+        for line in handle:
+          name, value = line.rsplit(':', 1)
+          self.memory[name] = int(value)
+
+  def _read_log(self, cache):
+    '''reads the entries added to the log since the cached state and updates the cache'''
+    file = os.path.join(self.path, 'log.txt')
+    stat = os.stat(file)
+    self.key = (stat.st_mtime_ns, stat.st_size)
+
+    if cache.get('key') == self.key:
+      self.log = cache['log']
+      return
+
+    log = cache.get('log', [])
+    offset = cache.get('offset', 0)
+    tail = cache.get('tail', b'')
+
+    with open(file, 'rb') as handle:
+      handle.seek(max(offset - len(tail), 0))
+
+      if offset > stat.st_size or handle.read(len(tail)) != tail:
+        log, offset, tail = [], 0, b''
+        handle.seek(0)
+
+      text = handle.read()
 
-    for v in self.log:
+    entries, length = _parse_entries(text.decode('utf-8'))
+    self._convert_entries(entries)
+
+    self.log = log + entries
+
+    cache['key'] = self.key
+    cache['log'] = self.log
+    cache['offset'] = offset + length
+    cache['tail'] = (tail + text[:length])[-TAIL_SIZE:]
+
+  def _convert_entries(self, entries):
+    for v in entries:
       v['main/error'] = 1.0 - v['main/accuracy']
-      v['validation/main/error'] = 1.0 - v['validation/main/accuracy']
 
       if v['main/loss'] >= 1000:
         v['main/loss'] = float('nan')
 
-      if v['validation/main/loss'] >= 1000:
+      # validation values are missing in epochs without evaluation
+      if 'validation/main/accuracy' in v:
+        v['validation/main/error'] = 1.0 - v['validation/main/accuracy']
+
+      if v.get('validation/main/loss', 0) >= 1000:
         v['validation/main/loss'] = float('nan')
 
   def make_graph(self, path):
@@ -52,13 +140,16 @@ class Data(object):
     figure = matplotlib.pyplot.figure(figsize=GRAPH_FIGURE_SIZE)
     plot = figure.add_subplot(1, 1, 1)
 
-    x = [v['epoch'] for v in self.log]
-
     y_max = 0.001
-    x_max = max(x)
+    x_max = max(v['epoch'] for v in self.log)
 
     for key, name in keys:
-      y = [v[key] for v in self.log]
+      x = [v['epoch'] for v in self.log if key in v]
+      y = [v[key] for v in self.log if key in v]
+
+      if len(y) == 0:
+        continue
+
       y_max = max(max(y) * 1.1, y_max)
 
       plot.plot(x, y, label=name, linewidth=1)
@@ -78,13 +169,35 @@ class Result(object):
   def __init__(self, path):
     self.path = path
     self.data_list = []
+    self._read_cache()
+
+    caches = self.cache['logs']
+    self.cache['logs'] = {}
 
     for meta in self._read_meta():
-      data = Data(os.path.join(self.path, meta[0]))
+      cache = caches.get(meta[0], {})
+      data = Data(os.path.join(self.path, meta[0]), cache)
       data.flag = meta[1]
       data.name = meta[2]
 
       self.data_list.append(data)
+      self.cache['logs'][meta[0]] = cache
+
+  def _read_cache(self):
+    '''reads the cache of logs and signatures of graphs made last time'''
+    try:
+      with open(os.path.join(self.path, CACHE_FILE), 'rb') as handle:
+        self.cache = pickle.load(handle)
+    except Exception:
+      self.cache = {'logs': {}, 'graphs': {}}
+
+  def _write_cache(self):
+    file = os.path.join(self.path, CACHE_FILE)
+
+    with open(file + '.tmp', 'wb') as handle:
+      pickle.dump(self.cache, handle)
+
+    os.replace(file + '.tmp', file)
 
   def _read_meta(self):
     meta_list = []
@@ -128,16 +241,40 @@ class Result(object):
 
     return meta_list
 
-  def make_graph(self):
+  def make_graph(self, processes=None):
+    '''makes the graphs whose data have been changed since the last time.
+    Graphs are made in parallel by the specified number of processes.
+    '''
+    graphs = self.cache['graphs']
+    signature = [(data.path, data.name, data.key) for data in self.data_list if data.flag]
+    tasks = []
+
     for data in self.data_list:
       if data.flag:
-        data.make_graph(os.path.join(self.path, os.path.basename(data.path)))
+        path = os.path.join(self.path, os.path.basename(data.path))
+        files = ['{}_loss.png'.format(path), '{}_error.png'.format(path)]
+        tasks.append((files, data.key, (data, 'make_graph', path)))
+
+    for args in [('main/loss', 'loss (train)', 'train_loss.png'),
+                 ('main/error', 'error rate (train)', 'train_error.png'),
+                 ('validation/main/loss', 'loss (validation)', 'test_loss.png'),
+                 ('validation/main/error', 'error rate (validation)', 'test_error1.png'),
+                 ('validation/main/error', 'error rate (validation)', 'test_error2.png', 'min')]:
+      files = [os.path.join(self.path, args[2])]
+      tasks.append((files, (signature, args), (self, '_make_graph') + args))
+
+    tasks = [(files, key, task) for files, key, task in tasks
+             if graphs.get(files[0]) != key or not all(os.path.isfile(f) for f in files)]
 
-    self._make_graph('main/loss', 'loss (train)', 'train_loss.png')
-    self._make_graph('main/error', 'error rate (train)', 'train_error.png')
-    self._make_graph('validation/main/loss', 'loss (validation)', 'test_loss.png')
-    self._make_graph('validation/main/error', 'error rate (validation)', 'test_error1.png')
-    self._make_graph('validation/main/error', 'error rate (validation)', 'test_error2.png', yrange='min')
+    if len(tasks) != 0:
+      with concurrent.futures.ProcessPoolExecutor(processes) as executor:
+        futures = [executor.submit(_call, *task) for _, _, task in tasks]
+
+        for (files, key, _), future in zip(tasks, futures):
+          future.result()
+          graphs[files[0]] = key
+
+    self._write_cache()
 
   def _make_graph(self, key, name, file, yrange='max'):
     figure = matplotlib.pyplot.figure(figsize=GRAPH_FIGURE_SIZE)
@@ -150,8 +287,11 @@ class Result(object):
       if not data.flag:
         continue
 
-      x = [v['epoch'] for v in data.log]
-      y = [v[key] for v in data.log]
+      x = [v['epoch'] for v in data.log if key in v]
+      y = [v[key] for v in data.log if key in v]
+
+      if len(y) == 0:
+        continue
 
       x_max = max(max(x), x_max)
 
@@ -173,17 +313,19 @@ class Result(object):
     matplotlib.pyplot.close()
 
   def __str__(self):
-    text = [['name', 'size', 'loss(train)', 'error(train)', 'loss(test)', 'error(test)']]
+    text = [['name', 'size', 'activation', 'peak', 'loss(train)', 'error(train)', 'loss(test)', 'error(test)']]
 
     for data in self.data_list:
       name = data.name
       size = '{:.2f}m'.format(data.size / 1000000)
-      train_loss = '{:.4f}'.format(min([v['main/loss'] for v in data.log]))
-      train_error = '{:.4f}'.format(min([v['main/error'] for v in data.log]))
-      test_loss = '{:.4f}'.format(min([v['validation/main/loss'] for v in data.log]))
-      test_error = '{:.4f}'.format(min([v['validation/main/error'] for v in data.log]))
-
-      text.append([name, size, train_loss, train_error, test_loss, test_error])
+      activation = '{:.1f}MB'.format(data.memory['/'] / 1000000) if '/' in data.memory else '-'
+      peak = '{:.1f}MB'.format(data.memory['peak'] / 1000000) if 'peak' in data.memory else '-'
+      train_loss = _format_min(data.log, 'main/loss')
+      train_error = _format_min(data.log, 'main/error')
+      test_loss = _format_min(data.log, 'validation/main/loss')
+      test_error = _format_min(data.log, 'validation/main/error')
+
+      text.append([name, size, activation, peak, train_loss, train_error, test_loss, test_error])
 
     spaces = [0] * len(text[0])
 
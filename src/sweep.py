@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+複数の学習を並列に実行するモジュール。
+ネットワーク、パラメータ、学習係数の変更方法、学習係数の初期値の組み合わせ毎に`train.py`を実行します。
+'''
+
+import os
+import re
+import sys
+import json
+import argparse
+import itertools
+import subprocess
+import concurrent.futures
+from train import get_result_dir, load_dataset
+
+THREAD_VARIABLES = ('OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS')
+
+
+class Run(object):
+  '''a training in the sweep'''
+  def __init__(self, dataset, network, params, learning, rate, with_rate):
+    path = get_result_dir(dataset, network, params, learning)
+
+    if with_rate:
+      path = '{}-r{}'.format(path, rate)
+
+    self.network = network
+    self.params = params
+    self.learning = learning
+    self.rate = rate
+    self.path = path
+    self.dirname = os.path.basename(path)
+    self.label = '{} {} ({}, lr={})'.format(network, ' '.join(str(v) for v in params), learning, rate)
+
+  def arguments(self, dataset):
+    return [dataset, self.network] + [str(v) for v in self.params] + \
+           ['--learning', self.learning, '--rate', str(self.rate), '--out', self.dirname]
+
+  def epoch(self):
+    '''returns the last epoch written in the log'''
+    file = os.path.join(self.path, 'log.txt')
+
+    if not os.path.isfile(file):
+      return 0
+
+    with open(file, 'r') as handle:
+      text = handle.read().strip()
+
+    try:
+      log = json.loads(text) if text.startswith('[') else [json.loads(v) for v in text.splitlines()]
+    except ValueError:
+      return 0
+
+    return log[-1]['epoch'] if len(log) != 0 else 0
+
+
+def parse_network(text):
+  '''parses `NETWORK:PARAM,PARAM,...` into the name and the parameters'''
+  m = re.match(r'^([a-z]+)(?::([0-9,]*))?$', text)
+
+  if not m:
+    raise argparse.ArgumentTypeError('invalid network: {}'.format(text))
+
+  return m.group(1), [int(v) for v in (m.group(2) or '').split(',') if v]
+
+
+def read_stopped(result_dir, dataset):
+  '''returns the names of runs stopped by successive halving'''
+  file = os.path.join(result_dir, 'halving.json')
+
+  if not os.path.isfile(file):
+    return set()
+
+  with open(file, 'r') as handle:
+    data = json.load(handle)
+
+  return set(name for records in data.get(dataset, {}).values() for name, v in records.items() if v['stop'])
+
+
+def write_meta(result_dir, runs):
+  '''appends the runs which are not listed in `meta.txt` of the result directory'''
+  file = os.path.join(result_dir, 'meta.txt')
+  paths = set()
+
+  if os.path.isfile(file):
+    with open(file, 'r') as handle:
+      paths = set(line.split(':')[0].strip() for line in handle if ':' in line)
+
+  with open(file, 'a') as handle:
+    for run in runs:
+      if run.dirname not in paths:
+        handle.write('{}: {}/{}\n'.format(run.dirname, True, run.label))
+
+
+def execute(run, dataset, options, threads):
+  '''executes the training with the thread budget and returns the exit code'''
+  env = dict(os.environ)
+
+  for name in THREAD_VARIABLES:
+    env[name] = str(threads)
+
+  command = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'train.py')]
+  command += run.arguments(dataset) + options
+
+  with open(os.path.join(run.path, 'stdout.txt'), 'a') as handle:
+    return subprocess.call(command, env=env, stdout=handle, stderr=subprocess.STDOUT)
+
+
+def main():
+  parser = argparse.ArgumentParser(description='sweep of trainings',
+                                   epilog='other options are passed to train.py')
+  parser.add_argument('dataset', metavar='DATASET', help='datasets name')
+  parser.add_argument('networks', type=parse_network, nargs='+',
+                      metavar='NETWORK:PARAMS', help='network name and comma separated parameters')
+  parser.add_argument('--learning', '-l', nargs='+', default=['step'], choices=('step', 'cosine', 'restart'),
+                      metavar='NAME', help='names of learning rate control')
+  parser.add_argument('--rate', '-r', type=float, nargs='+', default=[0.1],
+                      metavar='LEARNING_RATE', help='initial leaning rates')
+  parser.add_argument('--epoch', '-e', type=int, default=300,
+                      metavar='EPOCH', help='number of epochs for training')
+  parser.add_argument('--threads', type=int, default=1,
+                      metavar='THREADS', help='number of threads of a training')
+  parser.add_argument('--jobs', '-j', type=int, default=None,
+                      metavar='JOBS', help='number of parallel trainings (default: cores / threads)')
+  args, options = parser.parse_known_args()
+
+  jobs = args.jobs or max(os.cpu_count() // args.threads, 1)
+  options = ['--epoch', str(args.epoch)] + options
+
+  runs = [Run(args.dataset, network, params, learning, rate, len(args.rate) > 1)
+          for (network, params), learning, rate in itertools.product(args.networks, args.learning, args.rate)]
+  stopped = read_stopped(os.path.dirname(runs[0].path), args.dataset)
+  runs = [run for run in runs if run.epoch() < args.epoch and run.dirname not in stopped]
+
+  if len(runs) == 0:
+    print('all trainings have been completed')
+    return
+
+  # create the cache of the dataset shared by the trainings as memory maps
+  load_dataset(args.dataset)
+
+  for run in runs:
+    os.makedirs(run.path, exist_ok=True)
+
+  write_meta(os.path.dirname(runs[0].path), runs)
+
+  with concurrent.futures.ThreadPoolExecutor(jobs) as executor:
+    futures = {executor.submit(execute, run, args.dataset, options, args.threads): run for run in runs}
+
+    for future in concurrent.futures.as_completed(futures):
+      run = futures[future]
+      code = future.result()
+      print('{}: {}'.format(run.dirname, 'done' if code == 0 else 'failed ({})'.format(code)))
+
+
+if __name__ == '__main__':
+  main()
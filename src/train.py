@@ -1,19 +1,157 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+import time
+
+# the start of the process for startup.txt (measured before importing chainer)
+START_TIME = time.time()
+
 import os
 import argparse
+import hashlib
+import json
+import numpy
 import chainer
 import mylib
-from chainer.training import extensions
 
 
-def create_network(name, category, params):
-  '''create the specified network model'''
+# prefix of the parameters of the network in a snapshot of the trainer
+SNAPSHOT_PREFIX = 'updater/model:main/predictor/'
+
+# options of networks which change the architecture (other options, e.g. recompute, are not saved)
+ARCHITECTURE_ARGS = ('fused', 'shake')
+
+
+def create_network(name, category, params, **kwargs):
+  '''create the specified network model.
+  The options changing the architecture are kept as a persistent value `network_args` of the model,
+  so that the saved model can be created again by `load_network_args`.'''
   module = __import__('network.{0}'.format(name), fromlist=['Network'])
   cls = getattr(module, 'Network')
+  network = cls(category, params, **kwargs)
+  network_args = {k: v for k, v in kwargs.items() if k in ARCHITECTURE_ARGS}
+
+  if len(network_args) != 0:
+    network.add_persistent('network_args', json.dumps(network_args, sort_keys=True))
+
+  return network
+
+
+def load_network_args(path, prefix=''):
+  '''returns the options of the network saved in the model file (empty if they are not saved)'''
+  key = '{}network_args'.format(prefix)
+
+  with numpy.load(path) as npz:
+    return json.loads(str(npz[key])) if key in npz.files else {}
+
+
+def load_snapshot(path, trainer):
+  '''loads the snapshot of the trainer.
+  If the options of the network are not saved in the snapshot, those of the current network are kept.'''
+  network = trainer.updater.get_optimizer('main').target.predictor
+  key = '{}network_args'.format(SNAPSHOT_PREFIX)
+
+  with numpy.load(path) as npz:
+    if key in npz.files or not hasattr(network, 'network_args'):
+      chainer.serializers.NpzDeserializer(npz).load(trainer)
+      return
+
+    arrays = dict(npz.items())
+
+  arrays[key] = numpy.asarray(network.network_args)
+  chainer.serializers.NpzDeserializer(arrays).load(trainer)
+
+
+def get_source_hash(name):
+  '''returns the hash of the sources which the initialization of the network depends on
+  (the network module, the other modules of networks and mylib) and the version of chainer'''
+  src_dir = os.path.dirname(os.path.abspath(__file__))
+  paths = [os.path.join(src_dir, 'network', '{}.py'.format(name))]
+
+  for directory in [os.path.join(src_dir, 'network'), os.path.join(src_dir, 'mylib')]:
+    for root, dirs, files in os.walk(directory):
+      dirs.sort()
+      paths += [os.path.join(root, f) for f in sorted(files) if f.endswith('.py')]
+
+  digest = hashlib.sha1(chainer.__version__.encode('utf-8'))
+
+  for path in paths:
+    with open(path, 'rb') as handle:
+      digest.update(handle.read())
+
+  return digest.hexdigest()
+
+
+class _SkippedInitialization(object):
+  '''While it is entered, random values of initializers are not generated (arrays are filled with zeros).
+  It is used only when all the initialized parameters are overwritten by a cache.'''
+  def __enter__(self):
+    self._normal = numpy.random.normal
+    self._uniform = numpy.random.uniform
+    numpy.random.normal = lambda loc=0.0, scale=1.0, size=None: numpy.zeros(size)
+    numpy.random.uniform = lambda low=0.0, high=1.0, size=None: numpy.zeros(size)
+
+    return self
+
+  def __exit__(self, *_):
+    numpy.random.normal = self._normal
+    numpy.random.uniform = self._uniform
+
+
+def create_cached_network(cache_dir, name, category, params, seed, **kwargs):
+  '''create the specified network model, and initialize it by the cache if exists.
+  The initialized parameters are cached as a npz file with the state of the random generator after
+  the initialization, so that the training is the same as that without the cache. The key of the cache
+  includes the hash of the sources, and the network is always created by its class.'''
+  key = repr((name, category, list(params), seed, sorted(kwargs.items()), get_source_hash(name)))
+  path = os.path.join(cache_dir, '{}-{}.npz'.format(name, hashlib.sha1(key.encode('utf-8')).hexdigest()))
+
+  if os.path.isfile(path):
+    with _SkippedInitialization():
+      network = create_network(name, category, params, **kwargs)
+
+    with numpy.load(path) as npz:
+      for param_name, param in network.namedparams():
+        if param.data is not None:
+          param.data[...] = npz['params' + param_name]
+
+      numpy.random.set_state(('MT19937', npz['random/keys'], int(npz['random/pos']),
+                              int(npz['random/has_gauss']), float(npz['random/cached_gaussian'])))
+
+    return network, True
+
+  network = create_network(name, category, params, **kwargs)
+  state = numpy.random.get_state()
+  arrays = {'params' + n: p.data for n, p in network.namedparams() if p.data is not None}
+  arrays.update({'random/keys': state[1], 'random/pos': state[2],
+                 'random/has_gauss': state[3], 'random/cached_gaussian': state[4]})
+
+  os.makedirs(cache_dir, exist_ok=True)
+
+  with open('{}.{}.tmp'.format(path, os.getpid()), 'wb') as handle:
+    numpy.savez(handle, **arrays)
+
+  os.replace('{}.{}.tmp'.format(path, os.getpid()), path)
+
+  return network, False
+
 
-  return cls(category, params)
+def softmax_cross_entropy(y, t):
+  '''softmax cross entropy computed in float32'''
+  return chainer.functions.softmax_cross_entropy(mylib.functions.cast(y, numpy.float32), t)
+
+
+def get_result_dir(dataset, network, params, learning):
+  '''returns the directory where results of the specified training are saved'''
+  name = '{}-{}-{}-{}'.format(dataset, network, '-'.join([str(v) for v in params]), learning)
+  base_dir = os.path.join(os.path.dirname(__file__), os.path.pardir)
+
+  return os.path.normpath(os.path.join(base_dir, 'result', name))
+
+
+def align_rungs(rungs, ends):
+  '''moves every rung to the first end of cycles at or after the rung'''
+  return sorted(set(min(e for e in ends if e >= r) for r in rungs if len(ends) != 0 and r <= ends[-1]))
 
 
 def load_dataset(name):
@@ -45,10 +183,70 @@ def main():
                       metavar='BATCH_SIZE', help='batch size of training')
   parser.add_argument('--procsize', '-p', type=int, default=None,
                       metavar='DATA_SIZE', help='number of images at a training process')
+  parser.add_argument('--out', default=None,
+                      metavar='NAME', help='name of the result directory (default: DATASET-NETWORK-PARAMS-NAME)')
+  parser.add_argument('--eval-batchsize', type=int, default=500,
+                      metavar='BATCH_SIZE', help='batch size of evaluation')
+  parser.add_argument('--eval-interval', type=int, default=1,
+                      metavar='EPOCHS', help='interval of evaluation')
+  parser.add_argument('--eval-samples', type=int, default=None,
+                      metavar='IMAGES', help='number of test images evaluated (default: all)')
   parser.add_argument('--gpu', '-g', type=int, default=-1, 
                       metavar='GPU_ID', help='GPU ID')
+  parser.add_argument('--processes', type=int, default=1,
+                      metavar='PROCESSES', help='number of processes for computing gradients on CPU')
+  parser.add_argument('--loaders', type=int, default=0,
+                      metavar='PROCESSES', help='number of processes for loading training data')
+  parser.add_argument('--prefetch', type=int, default=2,
+                      metavar='BATCHES', help='number of batches loaded in advance')
+  parser.add_argument('--seed', type=int, default=None,
+                      metavar='SEED', help='random seed')
+  parser.add_argument('--dtype', default='float32', choices=('float32', 'float16'),
+                      metavar='DTYPE', help='dtype of activations and parameters of convolutions in training')
+  parser.add_argument('--fused', action='store_true', default=False,
+                      help='compute the two lines of shake-shake units by grouped convolutions (shakenet only)')
+  parser.add_argument('--shake', default=None, choices=('binary', 'shake-shake-image', 'shake-even', 'shake-keep'),
+                      metavar='MODE', help='mode of coefficients of shake-shake units (shakenet only)')
+  parser.add_argument('--recompute', action='store_true', default=False,
+                      help='recompute activations of blocks in backward computation to reduce memory')
+  parser.add_argument('--profile', type=int, default=0,
+                      metavar='ITERATIONS', help='interval of writing the profile of functions (0: disabled)')
+  parser.add_argument('--memory', action='store_true', default=False,
+                      help='write the memory usage of 3 iterations after the first one')
+  parser.add_argument('--halving', type=int, default=0,
+                      metavar='REDUCTION', help='reduction factor of successive halving among runs (0: disabled)')
+  parser.add_argument('--rungs', type=int, nargs='+', default=None,
+                      metavar='EPOCHS', help='epochs at which runs are compared by successive halving')
+  parser.add_argument('--async-snapshot', action='store_true', default=False,
+                      help='write snapshots in a background thread')
+  parser.add_argument('--log-format', default='json', choices=('json', 'jsonl'),
+                      metavar='FORMAT', help='format of log.txt (json: list rewritten every epoch, jsonl: appended lines)')
+  parser.add_argument('--no-plot', action='store_true', default=False, help='without plotting loss and accuracy')
+  parser.add_argument('--no-graph', action='store_true', default=False, help='without dumping computational graphs')
+  parser.add_argument('--no-cache', action='store_true', default=False,
+                      help='without caching initialized models (models are cached only if the seed is given)')
   parser.add_argument('--no-check', action='store_true', default=False, help='without type check of variables')
   args = parser.parse_args()
+  startup = mylib.training.extensions.StartupTime(START_TIME, filename='startup.txt')
+  startup.mark('import')
+
+  if args.processes > 1 and args.gpu >= 0:
+    parser.error('--processes can be used only on CPU')
+
+  if args.processes > 1 and args.dtype != 'float32':
+    parser.error('--processes can be used only with float32')
+
+  if args.processes > 1 and args.profile > 0:
+    parser.error('--profile cannot be used with --processes')
+
+  if args.processes > 1 and args.memory:
+    parser.error('--memory cannot be used with --processes')
+
+  if args.fused and args.network != 'shakenet':
+    parser.error('--fused can be used only with shakenet')
+
+  if args.shake is not None and args.network != 'shakenet':
+    parser.error('--shake can be used only with shakenet')
 
   if args.procsize is None:
     args.procsize = args.batchsize
@@ -56,16 +254,37 @@ def main():
   if args.no_check:
     chainer.config.type_check = False
 
-  name = '{}-{}-{}-{}'.format(args.dataset, args.network, '-'.join([str(v) for v in args.params]), args.learning)
-  base_dir = os.path.join(os.path.dirname(__file__), os.path.pardir)
-  result_dir = os.path.normpath(os.path.join(base_dir, 'result', name))
+  if args.seed is not None:
+    numpy.random.seed(args.seed)
+
+  result_dir = get_result_dir(args.dataset, args.network, args.params, args.learning)
+
+  if args.out is not None:
+    result_dir = os.path.join(os.path.dirname(result_dir), args.out)
 
   # load data-set
   category, train_data, test_data = load_dataset(args.dataset)
+  startup.mark('dataset')
 
   # create a neural network
-  network = create_network(args.network, category, args.params)
-  lossfun = chainer.functions.softmax_cross_entropy
+  network_args = {'recompute': args.recompute}
+
+  if args.fused:
+    network_args['fused'] = True
+
+  if args.shake is not None:
+    network_args['shake'] = args.shake
+
+  if args.seed is not None and not args.no_cache:
+    cache_dir = os.path.join(os.path.dirname(result_dir), '.cache')
+    network, cached = create_cached_network(cache_dir, args.network, category, args.params, args.seed,
+                                            **network_args)
+  else:
+    network, cached = create_network(args.network, category, args.params, **network_args), False
+
+  startup.mark('network (cached)' if cached else 'network')
+
+  lossfun = softmax_cross_entropy
   accfun = chainer.functions.accuracy
   classifier = chainer.links.Classifier(network, lossfun=lossfun, accfun=accfun)
 
@@ -73,29 +292,48 @@ def main():
     chainer.cuda.get_device(args.gpu).use()
     classifier.to_gpu()
 
+    if args.seed is not None:
+      chainer.cuda.cupy.random.seed(args.seed)
+
   # create optimizer
   optimizer = chainer.optimizers.MomentumSGD(lr=args.rate, momentum=args.momentum)
   optimizer.setup(classifier)
   optimizer.add_hook(chainer.optimizer.WeightDecay(args.decay))
 
   # create data iterators
-  train_iter = chainer.iterators.SerialIterator(train_data, args.batchsize, repeat=True, shuffle=True)
-  test_iter = chainer.iterators.SerialIterator(test_data, args.procsize, repeat=False, shuffle=False)
+  if args.loaders > 0:
+    train_iter = mylib.iterators.MultiprocessIterator(train_data, args.batchsize, repeat=True, shuffle=True,
+                                                      n_processes=args.loaders, n_prefetch=args.prefetch,
+                                                      seed=args.seed)
+  else:
+    train_iter = mylib.iterators.SerialIterator(train_data, args.batchsize, repeat=True, shuffle=True)
 
   # create trainer
-  updater = mylib.training.StandardUpdater(train_iter, optimizer, device=args.gpu, procsize=args.procsize)
+  if args.processes > 1:
+    updater = mylib.training.MultiprocessUpdater(train_iter, optimizer, device=args.gpu, procsize=args.procsize,
+                                                 n_processes=args.processes, seed=args.seed)
+  else:
+    updater = mylib.training.StandardUpdater(train_iter, optimizer, device=args.gpu, procsize=args.procsize,
+                                             dtype=args.dtype)
+
   trainer = chainer.training.Trainer(updater, (args.epoch, 'epoch'), out=result_dir)
+  trigger = mylib.training.trigger.IntervalTrigger
 
   # extension for evaluation
-  trainer.extend(extensions.Evaluator(test_iter, classifier, device=args.gpu))
+  trainer.extend(mylib.training.extensions.Evaluator(test_data, classifier, batchsize=args.eval_batchsize,
+                                                     device=args.gpu, samples=args.eval_samples,
+                                                     seed=args.seed),
+                 trigger=trigger(args.eval_interval, 'epoch'))
 
   # extension for controlling learning rate
   if args.learning == 'step':
-    trainer.extend(mylib.training.extensions.StepShift('lr', args.rate, args.epoch))
+    shift = mylib.training.extensions.StepShift('lr', args.rate, args.epoch)
   elif args.learning == 'cosine':
-    trainer.extend(mylib.training.extensions.CosineShift('lr', args.rate, args.epoch, 1))
+    shift = mylib.training.extensions.CosineShift('lr', args.rate, args.epoch, 1)
   elif args.learning == 'restart':
-    trainer.extend(mylib.training.extensions.CosineShift('lr', args.rate, 10, 2))
+    shift = mylib.training.extensions.CosineShift('lr', args.rate, 10, 2)
+
+  trainer.extend(shift)
 
   # extensions for logging
   plot_err_keys = ['main/loss', 'validation/main/loss']
@@ -104,29 +342,63 @@ def main():
                 'main/loss', 'validation/main/loss',
                 'main/accuracy', 'validation/main/accuracy',
                 'elapsed_time']
-  trigger = mylib.training.trigger.IntervalTrigger
 
-  trainer.extend(mylib.training.extensions.dump_graph('main/loss', out_name="variable.dot", remove_variable=False))
-  trainer.extend(mylib.training.extensions.dump_graph('main/loss', out_name="function.dot", remove_variable=True))
+  if not args.no_graph:
+    from mylib.training.extensions.network_graph import NetworkGraph
+
+    trainer.extend(NetworkGraph(train_data, batchsize=2, variable_name='variable.dot',
+                                function_name='function.dot', summary_name='graph.txt'))
+
   trainer.extend(mylib.training.extensions.dump_network_size(filename='size.txt'))
 
-  trainer.extend(extensions.snapshot(filename='snapshot.npz'), trigger=trigger(1, 'epoch'))
-  trainer.extend(mylib.training.extensions.Bestshot(filename='bestshot.npz', trigger=trigger(1, 'epoch')))
+  if args.memory:
+    trainer.extend(mylib.training.extensions.MemoryUsage(filename='memory.txt', iterations=3))
 
-  trainer.extend(mylib.training.extensions.LogReport(log_name='log.txt', trigger=trigger(1, 'epoch')))
+  trainer.extend(startup)
+
+  if args.profile > 0:
+    trainer.extend(mylib.training.extensions.FunctionProfile(filename='profile',
+                                                             trigger=trigger(args.profile, 'iteration')))
+
+  # each file has its own writer, so that the bestshot does not wait for the snapshot being written
+  def writer():
+    return mylib.training.extensions.AsyncWriter() if args.async_snapshot else None
+
+  trainer.extend(mylib.training.extensions.Snapshot(filename='snapshot.npz', writer=writer()),
+                 trigger=trigger(1, 'epoch'))
+  trainer.extend(mylib.training.extensions.Bestshot(filename='bestshot.npz', trigger=trigger(1, 'epoch'),
+                                                    writer=writer()))
+
+  # extension for successive halving among runs in the result directory
+  if args.halving > 1:
+    rungs = args.rungs or [args.epoch // 8, args.epoch // 4, args.epoch // 2]
+
+    if args.learning == 'restart':
+      ends = shift.get_cycle_ends(args.epoch)
+      rungs = ends if args.rungs is None else align_rungs(rungs, ends)
+
+    trainer.extend(mylib.training.extensions.SuccessiveHalving(rungs, args.dataset, reduction=args.halving,
+                                                               trigger=trigger(1, 'epoch')))
+
+  trainer.extend(mylib.training.extensions.LogReport(log_name='log.txt', trigger=trigger(1, 'epoch'),
+                                                          log_format=args.log_format))
   trainer.extend(mylib.training.extensions.PrintReport(print_keys, log_report='LogReport'))
   trainer.extend(mylib.training.extensions.PrintReport(print_keys, log_report='LogReport', out='out.txt'))
 
-  trainer.extend(mylib.training.extensions.PlotReport(plot_err_keys, 'epoch', file_name='loss.png',
-                                                      marker=None, trigger=trigger(1, 'epoch')))
-  trainer.extend(mylib.training.extensions.PlotReport(plot_acc_keys, 'epoch', file_name='accuracy.png',
-                                                      marker=None, trigger=trigger(1, 'epoch')))
+  if not args.no_plot:
+    from mylib.training.extensions.plot_report import PlotReport
+
+    trainer.extend(PlotReport(plot_err_keys, 'epoch', file_name='loss.png', marker=None, trigger=trigger(1, 'epoch')))
+    trainer.extend(PlotReport(plot_acc_keys, 'epoch', file_name='accuracy.png', marker=None,
+                              trigger=trigger(1, 'epoch')))
 
   # resume setting
   snapshot = os.path.join(result_dir, 'snapshot.npz')
 
   if os.path.isfile(snapshot):
-    chainer.serializers.load_npz(snapshot, trainer)
+    load_snapshot(snapshot, trainer)
+
+  startup.mark('setup')
 
   # start
   trainer.run()